@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 import sys, pathlib, json
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QIcon
-from ui import MainWin
+from startup import profile_from_argv
 
 CONFIG_PATH = pathlib.Path(__file__).parent / "config.json"
 
@@ -12,6 +10,21 @@ def load_config():
         "out_dir": str(pathlib.Path.home() / "Downloads"),
         "max_concurrent": 2,
         "concurrent_fragments": 16,
+        "rate_limit_mbs": 0,         # ограничение скорости одной загрузки, МБ/с (0 — нет)
+        "cookies_file": "cookies.txt",  # общий cookie jar для yt-dlp и превью ("" — без кук)
+        "cookies_domain": "",        # сайт для кук из строки «Cookie:» (напр. pornhub.com); пусто — не слать
+        "prefetch_depth": 2,         # сколько задач очереди извлекать заранее
+        "prefetch_concurrency": 1,
+        "schedule_policy": "fifo",   # fifo | sjf | fair
+        "events_log": "events.jsonl",    # JSONL-журнал фаз и итогов задач
+        "metrics_file": "metrics.prom",  # метрики в формате Prometheus (textfile)
+        "app_log": "app.jsonl",          # журнал приложения и вывода yt-dlp ("" — не писать)
+        "log_max_mb": 5,                 # ротация журнала по размеру
+        "log_backups": 3,
+        "log_lines": 500,                # строк в окне лога
+        "postprocess": False,            # faststart + обложка/название после загрузки (ffmpeg)
+        "postprocess_workers": 2,
+        "postprocess_per_disk": 1,       # одновременных обработок на один диск
     }
     try:
         if CONFIG_PATH.exists():
@@ -22,14 +35,30 @@ def load_config():
     return cfg
 
 def main():
+    prof = profile_from_argv(sys.argv)  # --profile-startup
+    # Qt и ui импортируем здесь, а не на уровне модуля — чтобы замер видел их целиком
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtGui import QIcon
+    if prof: prof.mark("import Qt")
     app = QApplication(sys.argv)
     app.setApplicationName("PH Loader")
     ico = pathlib.Path(__file__).parent / "assets" / "app.ico"
     if ico.exists():
         app.setWindowIcon(QIcon(str(ico)))
+    if prof: prof.mark("QApplication")
+    from ui import MainWin
+    if prof: prof.mark("import ui")
     cfg = load_config()
     w = MainWin(cfg, CONFIG_PATH)
+    if prof: prof.mark("MainWin()")
     w.show()
+    if prof:
+        prof.mark("show()")
+        from PySide6.QtCore import QTimer
+        def first_frame():
+            prof.mark("first event loop pass (window visible)")
+            prof.stop(); prof.report()
+        QTimer.singleShot(0, first_frame)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
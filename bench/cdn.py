@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Локальный «CDN» для бенчмарков: синтетические progressive-MP4 и HLS.
+
+Маршруты:
+  /watch/prog/<name>?size=N               — «страница» видео (JSON для заглушки-экстрактора)
+  /watch/hls/<name>?segments=K&seg=B      — то же для HLS
+  /media/<name>.mp4?size=N                — байты файла, поддерживает Range
+  /hls/<name>/index.m3u8?segments=K&seg=B — плейлист
+  /hls/<name>/seg<i>.ts?seg=B             — сегмент
+
+Задержка, полоса на соединение и троттлинг (429 на каждый N-й запрос к медиа)
+задаются через CdnConfig.
+"""
+import json, re, threading, time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import parse_qs, urlparse
+
+BLOCK = bytes(range(256)) * 256  # 64 КиБ детерминированных байт
+
+
+@dataclass
+class CdnConfig:
+    latency: float = 0.0     # задержка перед ответом, с
+    bandwidth: int = 0       # байт/с на соединение, 0 — без ограничения
+    throttle_every: int = 0  # каждый N-й запрос к медиа получает 429, 0 — никогда
+    chunk: int = 64 * 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "BenchCDN/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def cfg(self) -> CdnConfig:
+        return self.server.cfg
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        if self.cfg.latency:
+            time.sleep(self.cfg.latency)
+        m = re.fullmatch(r"/watch/(prog|hls)/([\w-]+)", u.path)
+        if m:
+            return self._page(m.group(1), m.group(2), q)
+        if (u.path.startswith("/media/") or u.path.startswith("/hls/")) and self._throttled():
+            return self._send_error(429, "Too Many Requests")
+        m = re.fullmatch(r"/media/([\w-]+)\.mp4", u.path)
+        if m:
+            return self._bytes(int(q.get("size", 1 << 20)), "video/mp4")
+        m = re.fullmatch(r"/hls/([\w-]+)/index\.m3u8", u.path)
+        if m:
+            return self._playlist(int(q.get("segments", 10)), int(q.get("seg", 256 * 1024)))
+        m = re.fullmatch(r"/hls/([\w-]+)/seg(\d+)\.ts", u.path)
+        if m:
+            return self._bytes(int(q.get("seg", 256 * 1024)), "video/mp2t")
+        self._send_error(404, "Not Found")
+
+    def _throttled(self) -> bool:
+        n = self.cfg.throttle_every
+        if not n:
+            return False
+        with self.server.lock:
+            self.server.media_requests += 1
+            return self.server.media_requests % n == 0
+
+    def _send_error(self, code: int, msg: str):
+        body = msg.encode()
+        self.send_response(code, msg)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, kind: str, name: str, q: dict):
+        if kind == "prog":
+            size = int(q.get("size", 1 << 20))
+            info = {"title": name, "kind": "progressive", "size": size,
+                    "media": f"/media/{name}.mp4?size={size}"}
+        else:
+            k, b = int(q.get("segments", 10)), int(q.get("seg", 256 * 1024))
+            info = {"title": name, "kind": "hls", "size": k * b, "segments": k,
+                    "media": f"/hls/{name}/index.m3u8?segments={k}&seg={b}"}
+        body = json.dumps(info).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _playlist(self, segments: int, seg: int):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(segments):
+            lines += ["#EXTINF:4.0,", f"seg{i}.ts?seg={seg}"]
+        lines.append("#EXT-X-ENDLIST")
+        body = ("\n".join(lines) + "\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _bytes(self, size: int, ctype: str):
+        start, end = 0, size - 1
+        rng = self.headers.get("Range")
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", rng or "")
+        if m:
+            start = int(m.group(1))
+            end = min(end, int(m.group(2))) if m.group(2) else end
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self._stream(start, end + 1)
+
+    def _stream(self, start: int, stop: int):
+        bw, chunk = self.cfg.bandwidth, self.cfg.chunk
+        t0, sent, pos = time.monotonic(), 0, start
+        try:
+            while pos < stop:
+                off = pos % len(BLOCK)
+                n = min(chunk, stop - pos, len(BLOCK) - off)
+                self.wfile.write(BLOCK[off:off + n])
+                pos += n; sent += n
+                if bw:
+                    ahead = sent / bw - (time.monotonic() - t0)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(cfg: CdnConfig = None, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Запустить сервер в фоновом потоке. Возвращает (server, base_url)."""
+    srv = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    srv.daemon_threads = True
+    srv.cfg = cfg or CdnConfig()
+    srv.lock = threading.Lock()
+    srv.media_requests = 0
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Локальный CDN для бенчмарков")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--bandwidth", type=int, default=0, help="байт/с на соединение")
+    ap.add_argument("--throttle-every", type=int, default=0)
+    a = ap.parse_args()
+    srv, base = serve(CdnConfig(a.latency, a.bandwidth, a.throttle_every), a.port)
+    print(f"serving on {base}  (например {base}/watch/prog/clip?size=10485760)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Заглушка yt-dlp для бенчмарков: понимает «страницы» bench/cdn.py.
+
+Поддерживает ровно то подмножество CLI, которое использует workers.py:
+``-j URL``, ``--load-info-json FILE``, ``-o``, ``--concurrent-fragments``,
+``--continue``; остальные флаги принимаются и игнорируются. Вывод прогресса
+повторяет формат yt-dlp, чтобы его разбирал тот же DownloadWorker.
+"""
+import json, sys, time, urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urljoin
+
+VALUE_OPTS = {"-f", "-o", "--merge-output-format", "--concurrent-fragments", "--load-info-json",
+              "--cookies", "--user-agent", "--limit-rate", "-r", "--add-header", "--ffmpeg-location"}
+
+
+def parse_args(argv):
+    opts, pos, i = {}, [], 0
+    while i < len(argv):
+        a = argv[i]
+        if a in VALUE_OPTS:
+            opts[a] = argv[i + 1] if i + 1 < len(argv) else ""
+            i += 2
+            continue
+        if a.startswith("-"):
+            opts[a] = True
+        else:
+            pos.append(a)
+        i += 1
+    return opts, pos
+
+
+def extract(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=30) as r:
+        page = json.loads(r.read())
+    media = urljoin(url, page["media"])
+    fmt = {"format_id": "0", "url": media, "ext": "mp4", "height": 720, "width": 1280,
+           "vcodec": "avc1", "acodec": "mp4a", "filesize": page["size"],
+           "protocol": "m3u8_native" if page["kind"] == "hls" else "https"}
+    return {"id": page["title"], "title": page["title"], "webpage_url": url, "ext": "mp4",
+            "duration": 60, "thumbnail": None, "formats": [fmt], "filesize": page["size"],
+            "_bench_segments": page.get("segments", 0)}
+
+
+def _fmt(n: float) -> str:
+    return f"{n / 2 ** 20:.2f}MiB"
+
+
+class Progress:
+    def __init__(self, total: int, frags: int = 0):
+        self.total, self.frags, self.done, self.frag = total, frags, 0, 0
+        self.t0 = self.last = time.monotonic()
+
+    def add(self, n: int, frag: bool = False, force: bool = False):
+        self.done += n
+        self.frag += 1 if frag else 0
+        now = time.monotonic()
+        if not force and now - self.last < 0.1:
+            return
+        self.last = now
+        spd = self.done / max(1e-6, now - self.t0)
+        eta = int((self.total - self.done) / spd) if spd > 0 else 0
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        tail = f" (frag {self.frag}/{self.frags})" if self.frags else ""
+        print(f"[download] {pct:5.1f}% of {_fmt(self.total)} at {_fmt(spd)}/s ETA {eta // 60:02d}:{eta % 60:02d}{tail}",
+              flush=True)
+
+
+def _http_error(e: urllib.error.HTTPError) -> int:
+    print(f"ERROR: unable to download video data: HTTP Error {e.code}: {e.reason}", flush=True)
+    return 1
+
+
+def download_progressive(url: str, size: int, part: Path) -> int:
+    have = part.stat().st_size if part.exists() else 0
+    req = urllib.request.Request(url, headers={"Range": f"bytes={have}-"} if have else {})
+    prog = Progress(size)
+    prog.add(have, force=True)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as r, part.open("ab") as f:
+            while True:
+                buf = r.read(256 * 1024)
+                if not buf:
+                    break
+                f.write(buf)
+                prog.add(len(buf))
+    except urllib.error.HTTPError as e:
+        return _http_error(e)
+    prog.add(0, force=True)
+    return 0
+
+
+def download_hls(url: str, size: int, part: Path, workers: int) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=30) as r:
+            segs = [urljoin(url, l) for l in r.read().decode().splitlines() if l and not l.startswith("#")]
+    except urllib.error.HTTPError as e:
+        return _http_error(e)
+    print(f"[hlsnative] Total fragments: {len(segs)}", flush=True)
+    prog = Progress(size, len(segs))
+
+    def fetch(u):
+        with urllib.request.urlopen(u, timeout=30) as r:
+            data = r.read()
+        return data
+
+    try:
+        with ThreadPoolExecutor(max(1, workers)) as ex, part.open("wb") as f:
+            for data in ex.map(fetch, segs):
+                f.write(data)
+                prog.add(len(data), frag=True)
+    except urllib.error.HTTPError as e:
+        return _http_error(e)
+    prog.add(0, force=True)
+    return 0
+
+
+def main(argv) -> int:
+    opts, pos = parse_args(argv)
+    try:
+        if opts.get("--load-info-json"):
+            info = json.loads(Path(opts["--load-info-json"]).read_text(encoding="utf-8"))
+        elif pos:
+            info = extract(pos[0])
+        else:
+            print("ERROR: You must provide at least one URL.", flush=True)
+            return 2
+    except urllib.error.HTTPError as e:
+        return _http_error(e)
+    except Exception as e:
+        print(f"ERROR: Unable to download webpage: {e}", flush=True)
+        return 1
+    if opts.get("-j"):
+        print(json.dumps(info), flush=True)
+        return 0
+
+    fmt = info["formats"][0]
+    tmpl = opts.get("-o") or "%(title)s.%(ext)s"
+    dest = Path(tmpl.replace("%(title)s", info["title"]).replace("%(ext)s", info["ext"]))
+    part = dest.with_name(dest.name + ".part")
+    print(f"[download] Destination: {dest}", flush=True)
+    if fmt["protocol"].startswith("m3u8"):
+        rc = download_hls(fmt["url"], fmt["filesize"], part, int(opts.get("--concurrent-fragments") or 1))
+    else:
+        rc = download_progressive(fmt["url"], fmt["filesize"], part)
+    if rc == 0:
+        part.replace(dest)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Воспроизводимые бенчмарки DownloadManager без реальных сайтов.
+
+    python bench/run.py            # все сценарии, результат дописывается в bench/history.json
+    python bench/run.py --quick    # уменьшенные размеры
+    python bench/run.py --only hls --no-save
+
+Сценарии гоняют настоящий DownloadManager/DownloadWorker, но yt-dlp подменён
+заглушкой bench/fake_ytdlp.py (через PH_YTDLP), а медиа отдаёт bench/cdn.py.
+"""
+import argparse, json, os, shutil, stat, subprocess, sys, tempfile, time, tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from PySide6.QtCore import QCoreApplication, QTimer  # noqa: E402
+from cdn import CdnConfig, serve  # noqa: E402
+import session  # noqa: E402
+from telemetry import Telemetry, _quantile  # noqa: E402
+from workers import DownloadManager  # noqa: E402
+
+HISTORY = Path(__file__).resolve().parent / "history.json"
+MiB = 2 ** 20
+TERMINAL = ("Готово", "Ошибка", "Отменено")
+
+
+def make_stub(tmp: Path) -> str:
+    fake = Path(__file__).resolve().parent / "fake_ytdlp.py"
+    if sys.platform.startswith("win"):
+        p = tmp / "yt-dlp.bat"
+        p.write_text(f'@"{sys.executable}" "{fake}" %*\n', encoding="utf-8")
+    else:
+        p = tmp / "yt-dlp"
+        p.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{fake}" "$@"\n', encoding="utf-8")
+        p.chmod(p.stat().st_mode | stat.S_IEXEC)
+    return str(p)
+
+
+def _cpu() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def run_transfer(app, urls, cdn: CdnConfig, max_concurrent: int = 2,
+                 fragments: int = 4, policy: str = "fifo", timeout: float = 300.0) -> dict:
+    srv, base = serve(cdn)
+    out = Path(tempfile.mkdtemp(prefix="phbench_"))
+    tel = Telemetry()
+    m = DownloadManager(max_concurrent, fragments, policy=policy, telemetry=tel)
+    events = {"progress": 0, "metrics": 0, "status": 0}
+    left = set()
+    m.task_progress.connect(lambda *_: events.__setitem__("progress", events["progress"] + 1))
+    m.task_metrics.connect(lambda *_: events.__setitem__("metrics", events["metrics"] + 1))
+
+    def on_status(t):
+        events["status"] += 1
+        if t.get("status", "").startswith(TERMINAL):
+            left.discard(t["id"])
+            if not left:
+                app.quit()
+    m.task_status.connect(on_status)
+
+    cpu0, t0 = _cpu(), time.perf_counter()
+    for u in urls:
+        left.add(m.enqueue(base + u, str(out), Path(u.split("?")[0]).name, None))
+    guard = QTimer(); guard.setSingleShot(True); guard.timeout.connect(app.quit)
+    guard.start(int(timeout * 1000))
+    if left:
+        app.exec()
+    guard.stop()
+    wall = time.perf_counter() - t0
+    cpu = _cpu() - cpu0
+    srv.shutdown()
+
+    recs = [r for r in tel._done if r.get("status") == "done"]
+    mb = sum(r["mb"] for r in recs)
+    ttfb = [r["ttfb"] for r in recs if r.get("ttfb") is not None]
+    n_ev = sum(events.values())
+    shutil.rmtree(out, ignore_errors=True)
+    return {
+        "tasks": len(urls), "done": len(recs), "timed_out": bool(left),
+        "wall_s": round(wall, 3), "mb": round(mb, 2),
+        "throughput_mbs": round(mb / wall, 3) if wall else 0.0,
+        "ttfb_p50_s": round(_quantile(ttfb, 0.5), 3), "ttfb_p95_s": round(_quantile(ttfb, 0.95), 3),
+        "cpu_s_per_mb": round(cpu / mb, 4) if mb else None,
+        "events": n_ev, "events_per_s": round(n_ev / wall, 1) if wall else 0.0,
+        "retries": sum(r["retries"] for r in recs),
+    }
+
+
+def run_queue_memory(n: int) -> dict:
+    m = DownloadManager(1, prefetch_depth=0, policy="sjf")
+    m.max_concurrent = 0  # ничего не стартует — меряем только очередь
+    tracemalloc.start()
+    base_mem = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    for i in range(n):
+        m.enqueue(f"http://127.0.0.1:1/watch/prog/q{i}?size={MiB}", tempfile.gettempdir(), f"q{i}", None,
+                  expected_mb=float(i % 97 + 1))
+    enq = time.perf_counter() - t0
+    mem = tracemalloc.get_traced_memory()[0] - base_mem
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    with m._lock:
+        m._ordered_queue()
+    order = time.perf_counter() - t0
+    return {"tasks": n, "bytes_per_task": round(mem / n), "enqueue_us_per_task": round(enq / n * 1e6, 1),
+            "order_ms": round(order * 1000, 3)}
+
+
+def scenarios(quick: bool) -> dict:
+    k = 1 if quick else 4
+    return {
+        "progressive": lambda app: run_transfer(
+            app, [f"/watch/prog/p{i}?size={8 * k * MiB}" for i in range(4)],
+            CdnConfig(latency=0.02, bandwidth=16 * MiB)),
+        "hls": lambda app: run_transfer(
+            app, [f"/watch/hls/h{i}?segments={16 * k}&seg={256 * 1024}" for i in range(4)],
+            CdnConfig(latency=0.01, bandwidth=8 * MiB), fragments=4),
+        "unthrottled_ttfb": lambda app: run_transfer(
+            app, [f"/watch/prog/s{i}?size={MiB}" for i in range(10 * k)],
+            CdnConfig(latency=0.05), max_concurrent=2),
+        "throttled": lambda app: run_transfer(
+            app, [f"/watch/prog/t{i}?size={2 * MiB}" for i in range(4)],
+            CdnConfig(latency=0.02, bandwidth=8 * MiB, throttle_every=3)),
+        "queue_1": lambda app: run_queue_memory(1),
+        "queue_10": lambda app: run_queue_memory(10),
+        "queue_1000": lambda app: run_queue_memory(1000),
+    }
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare(prev: dict, cur: dict):
+    for scen, res in cur.items():
+        old = prev.get(scen) or {}
+        print(f"== {scen}")
+        for key, v in res.items():
+            o = old.get(key)
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and isinstance(o, (int, float)) and o:
+                print(f"   {key:22} {v:>12}   (было {o}, {100.0 * (v - o) / o:+.1f}%)")
+            else:
+                print(f"   {key:22} {v:>12}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарки загрузчика на локальном CDN")
+    ap.add_argument("--quick", action="store_true", help="уменьшенные размеры")
+    ap.add_argument("--only", action="append", help="запустить только указанный сценарий (можно несколько)")
+    ap.add_argument("--no-save", action="store_true", help="не дописывать результат в history.json")
+    a = ap.parse_args()
+
+    app = QCoreApplication(sys.argv[:1])
+    tmp = Path(tempfile.mkdtemp(prefix="phbench_bin_"))
+    os.environ["PH_YTDLP"] = make_stub(tmp)
+    session.configure(None)  # локальный CDN — без кук пользователя
+
+    results = {}
+    for name, fn in scenarios(a.quick).items():
+        if a.only and name not in a.only:
+            continue
+        print(f"... {name}", flush=True)
+        results[name] = fn(app)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    history = []
+    if HISTORY.exists():
+        try:
+            history = json.loads(HISTORY.read_text(encoding="utf-8"))
+        except Exception:
+            history = []
+    prev = next((h["results"] for h in reversed(history) if h.get("quick") == a.quick), {})
+    compare(prev, results)
+    if not a.no_save:
+        history.append({"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "rev": git_rev(), "quick": a.quick,
+                        "platform": sys.platform, "results": results})
+        HISTORY.write_text(json.dumps(history, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import os, socket, sqlite3, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    url         TEXT NOT NULL,
+    out_dir     TEXT NOT NULL DEFAULT '',
+    title       TEXT NOT NULL DEFAULT '',
+    height      INTEGER,
+    state       TEXT NOT NULL DEFAULT 'queued',  -- queued | leased | done | failed
+    owner       TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    created     REAL NOT NULL,
+    finished    REAL,
+    path        TEXT,
+    mb          REAL,
+    error       TEXT,
+    last_owner  TEXT,   -- узел, у которого задание последний раз упало с retry
+    not_before  REAL    -- до этого момента last_owner его не берёт
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, id);
+"""
+COLUMNS = ("id", "url", "out_dir", "title", "height", "state", "owner", "lease_until",
+           "attempts", "created", "finished", "path", "mb", "error", "last_owner", "not_before")
+# колонки, добавленные после первой версии схемы: старые базы догоняются ALTER TABLE
+MIGRATIONS = (("last_owner", "TEXT"), ("not_before", "REAL"))
+
+
+def node_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Общая очередь заданий для нескольких узлов на одном файле SQLite.
+
+    Узел забирает задание ``claim()`` на время аренды (lease) и продлевает её
+    ``heartbeat()``, пока качает. Если узел упал или пропал из сети, аренда
+    истекает и задание достаётся следующему ``claim()`` — после ``max_attempts``
+    таких переходов оно помечается ошибкой. Итоги (``complete`` / ``fail``)
+    остаются в той же таблице — это и есть общий индекс результатов.
+
+    Файл может лежать на общем диске (SMB/NFS): журнал обычный (DELETE, не WAL —
+    WAL требует общей памяти и по сети не работает), каждая операция — короткая
+    транзакция ``BEGIN IMMEDIATE``, занятость базы пережидается ``busy_timeout``.
+    """
+
+    def __init__(self, path, lease: float = 60.0, max_attempts: int = 5, retry_delay: float = 300.0):
+        self.path = Path(path)
+        self.lease = float(lease)
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_delay = float(retry_delay)
+        self._local = threading.local()  # sqlite3-соединение на поток
+        db = self._db()
+        db.executescript(SCHEMA)
+        have = {r[1] for r in db.execute("PRAGMA table_info(jobs)")}
+        for name, kind in MIGRATIONS:
+            if name not in have:
+                try:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+                except sqlite3.OperationalError:
+                    pass  # другой узел успел добавить колонку первым
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.execute("PRAGMA busy_timeout=30000")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    # --- постановка ---
+    def submit(self, url: str, out_dir: str = "", title: str = "", height: Optional[int] = None) -> int:
+        with self._tx() as db:
+            cur = db.execute("INSERT INTO jobs(url, out_dir, title, height, created) VALUES (?, ?, ?, ?, ?)",
+                             (url, out_dir, title, height, time.time()))
+            return cur.lastrowid
+
+    # --- аренда ---
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Взять следующее свободное задание (или с истёкшей арендой) или None.
+
+        Задание, которое у этого же узла только что упало с ``retry``, до
+        ``not_before`` пропускается — пусть его попробует другой узел.
+        """
+        now = time.time()
+        with self._tx() as db:
+            # чужие аренды, которые истекли слишком много раз, — в ошибки
+            db.execute("UPDATE jobs SET state='failed', owner=NULL, finished=?, error='аренда истекла' "
+                       "WHERE state='leased' AND lease_until < ? AND attempts >= ?",
+                       (now, now, self.max_attempts))
+            row = db.execute("SELECT " + ", ".join(COLUMNS) + " FROM jobs "
+                             "WHERE (state='queued' AND NOT (last_owner IS ? AND not_before > ?)) "
+                             "OR (state='leased' AND lease_until < ?) "
+                             "ORDER BY id LIMIT 1", (owner, now, now)).fetchone()
+            if row is None:
+                return None
+            job = dict(zip(COLUMNS, row))
+            db.execute("UPDATE jobs SET state='leased', owner=?, lease_until=?, attempts=attempts+1 WHERE id=?",
+                       (owner, now + self.lease, job["id"]))
+        job.update(state="leased", owner=owner, lease_until=now + self.lease, attempts=job["attempts"] + 1)
+        return job
+
+    def heartbeat(self, owner: str, job_ids: List[int]) -> List[int]:
+        """Продлить аренду; возвращает задания, которые узел уже потерял."""
+        if not job_ids:
+            return []
+        until = time.time() + self.lease
+        lost = []
+        with self._tx() as db:
+            for jid in job_ids:
+                cur = db.execute("UPDATE jobs SET lease_until=? WHERE id=? AND owner=? AND state='leased'",
+                                 (until, jid, owner))
+                if cur.rowcount == 0:
+                    lost.append(jid)
+        return lost
+
+    def complete(self, owner: str, job_id: int, path: str = "", mb: Optional[float] = None) -> bool:
+        with self._tx() as db:
+            cur = db.execute("UPDATE jobs SET state='done', lease_until=NULL, finished=?, path=?, mb=?, error=NULL "
+                             "WHERE id=? AND owner=? AND state='leased'",
+                             (time.time(), path, mb, job_id, owner))
+            return cur.rowcount == 1
+
+    def fail(self, owner: str, job_id: int, error: str, retry: bool = False) -> bool:
+        """Зафиксировать ошибку; ``retry`` — вернуть задание в очередь другим узлам."""
+        with self._tx() as db:
+            if retry:
+                cur = db.execute("UPDATE jobs SET state='queued', owner=NULL, lease_until=NULL, error=?, "
+                                 "last_owner=?, not_before=? "
+                                 "WHERE id=? AND owner=? AND state='leased' AND attempts < ?",
+                                 (error, owner, time.time() + self.retry_delay, job_id, owner,
+                                  self.max_attempts))
+                if cur.rowcount:
+                    return True
+            cur = db.execute("UPDATE jobs SET state='failed', lease_until=NULL, finished=?, error=? "
+                             "WHERE id=? AND owner=? AND state='leased'",
+                             (time.time(), error, job_id, owner))
+            return cur.rowcount == 1
+
+    def release(self, owner: str, job_ids: List[int]):
+        """Вернуть задания в очередь без попытки (узел останавливается)."""
+        with self._tx() as db:
+            for jid in job_ids:
+                db.execute("UPDATE jobs SET state='queued', owner=NULL, lease_until=NULL, attempts=MAX(0, attempts-1) "
+                           "WHERE id=? AND owner=? AND state='leased'", (jid, owner))
+
+    # --- индекс ---
+    def counts(self) -> Dict[str, int]:
+        rows = self._db().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def results(self, state: str = "done", limit: int = 100) -> List[Dict[str, Any]]:
+        rows = self._db().execute("SELECT " + ", ".join(COLUMNS) + " FROM jobs WHERE state=? "
+                                  "ORDER BY finished DESC LIMIT ?", (state, limit)).fetchall()
+        return [dict(zip(COLUMNS, r)) for r in rows]
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
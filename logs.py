@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import atexit, itertools, json, os, queue, threading, time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+class JsonlSink:
+    """Запись событий в JSONL из фонового потока с ротацией по размеру.
+
+    ``put()`` только кладёт словарь в очередь — сериализация и диск живут в
+    своём потоке, так что вызывающий (в том числе поток чтения вывода yt-dlp)
+    не ждёт файловую систему. При превышении ``max_bytes`` файл сдвигается в
+    ``.1`` (``.1`` → ``.2`` …), хранится не больше ``backups`` старых файлов.
+    """
+
+    def __init__(self, path, max_bytes: int = 5 * 2 ** 20, backups: int = 3):
+        self.path = Path(path)
+        self.max_bytes = max(64 * 1024, int(max_bytes))
+        self.backups = max(0, int(backups))
+        self._q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, rec: Dict[str, Any]):
+        self._q.put(rec)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout=2.0)
+
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else self.path.with_name(f"{self.path.name}.{i - 1}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i}"))
+        if not self.backups:
+            self.path.unlink(missing_ok=True)
+
+    def _run(self):
+        f, size = None, 0
+        while True:
+            rec = self._q.get()
+            batch = [rec]
+            # всё, что успело накопиться, пишем одним заходом
+            while rec is not None:
+                try:
+                    rec = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(rec)
+            stop = batch[-1] is None
+            try:
+                if f is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    f = self.path.open("ab")
+                    size = f.tell()
+                buf = []
+                for r in batch:
+                    if r is None:
+                        continue
+                    line = (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8")
+                    if size and size + len(line) > self.max_bytes:
+                        f.write(b"".join(buf)); buf = []
+                        f.close()
+                        self._rotate()
+                        f = self.path.open("ab")
+                        size = 0
+                    buf.append(line)
+                    size += len(line)
+                f.write(b"".join(buf))
+                f.flush()
+            except Exception:
+                f = None  # диск недоступен — попробуем переоткрыть на следующей пачке
+            if stop:
+                if f is not None:
+                    f.close()
+                return
+
+
+class LogHub:
+    """Единый журнал приложения.
+
+    * кольцевой буфер последних ``ring`` записей — из него рисуется окно лога;
+      читатель забирает новые записи по номеру (``since(seq)``), а не через
+      сигнал на каждую строку;
+    * последние строки вывода yt-dlp по задаче (``keep_tail`` / ``tail``) —
+      для отчёта об ошибке;
+    * необязательный ``JsonlSink`` — всё, включая вывод движка, уходит в файл.
+    """
+
+    def __init__(self, ring: int = 500, sink: Optional[JsonlSink] = None, tails: int = 200):
+        self._ring: deque = deque(maxlen=ring)
+        self._seq = itertools.count(1)
+        self._tails: Dict[int, List[str]] = {}
+        self._tails_order: deque = deque(maxlen=tails)  # хвосты держим только для последних задач
+        self._lock = threading.Lock()
+        self.sink = sink
+
+    def log(self, msg: str, level: str = "info", task: Optional[int] = None, **extra):
+        ts = time.time()
+        with self._lock:
+            rec = (next(self._seq), ts, level, task, msg)
+            self._ring.append(rec)
+        if self.sink:
+            self.sink.put(dict(ts=round(ts, 3), level=level, task=task, msg=msg, **extra))
+
+    def info(self, msg: str, task: Optional[int] = None):
+        self.log(msg, "info", task)
+
+    def warn(self, msg: str, task: Optional[int] = None):
+        self.log(msg, "warn", task)
+
+    def error(self, msg: str, task: Optional[int] = None, **extra):
+        self.log(msg, "error", task, **extra)
+
+    def engine(self, task: int, line: str):
+        # строки yt-dlp — только в файл: окно лога они бы забили
+        if self.sink:
+            self.sink.put({"ts": round(time.time(), 3), "level": "engine", "task": task, "msg": line})
+
+    def keep_tail(self, task: int, lines: List[str]):
+        with self._lock:
+            if task not in self._tails:
+                if len(self._tails_order) == self._tails_order.maxlen:
+                    self._tails.pop(self._tails_order[0], None)
+                self._tails_order.append(task)
+            self._tails[task] = list(lines)
+
+    def tail(self, task: int) -> List[str]:
+        with self._lock:
+            return list(self._tails.get(task, ()))
+
+    def since(self, seq: int) -> List[tuple]:
+        """Записи буфера с номером больше ``seq``: (seq, ts, level, task, msg)."""
+        with self._lock:
+            if not self._ring or self._ring[-1][0] <= seq:
+                return []
+            return [r for r in self._ring if r[0] > seq]
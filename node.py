@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Безоконный узел распределённой загрузки.
+
+    python node.py submit --queue Z:/share/jobs.db URL [URL ...]
+    python node.py run    --queue Z:/share/jobs.db --out Z:/share/video
+    python node.py status --queue Z:/share/jobs.db
+
+Каждый ``run`` — отдельный узел: берёт задания из общей очереди (jobqueue.py)
+в аренду, качает их обычным DownloadManager и пишет итог обратно в ту же базу.
+Чтобы качать быстрее, достаточно запустить ещё узлы на других машинах.
+"""
+import argparse, signal, sys
+from pathlib import Path
+from typing import Dict
+
+from jobqueue import JobQueue, node_name
+from retry import HOST_FAILURES, LOCAL
+
+TERMINAL = ("Готово", "Ошибка", "Отменено")
+
+
+def _node_class():
+    # Qt и менеджер нужны только для run — submit/status работают без PySide6
+    from PySide6.QtCore import QObject, QTimer
+    from workers import DownloadManager
+
+    class Node(QObject):
+        """Связка общей очереди и локального DownloadManager."""
+
+        def __init__(self, queue: JobQueue, manager: DownloadManager, out_dir: str, poll: float = 2.0):
+            super().__init__()
+            self.queue = queue
+            self.manager = manager
+            self.out_dir = out_dir
+            self.name = node_name()
+            self._jobs: Dict[int, int] = {}  # task_id -> job_id
+            manager.task_status.connect(self._on_status)
+            self._poll = QTimer(self)
+            self._poll.timeout.connect(self._fill)
+            self._poll.start(int(poll * 1000))
+            self._beat = QTimer(self)
+            self._beat.timeout.connect(self._heartbeat)
+            self._beat.start(int(queue.lease * 1000 / 3))  # три шанса продлить аренду до истечения
+
+        def _fill(self):
+            while len(self._jobs) < self.manager.max_concurrent:
+                job = self.queue.claim(self.name)
+                if job is None:
+                    return
+                # своя подпись на задание: пустое название превратилось бы в общее «—» для всех задач
+                title = job["title"] or f"#{job['id']} {job['url']}"
+                tid = self.manager.enqueue(job["url"], job["out_dir"] or self.out_dir, title, job["height"])
+                self._jobs[tid] = job["id"]
+                print(f"[{self.name}] задание {job['id']} (попытка {job['attempts']}): {job['url']}", flush=True)
+
+        def _heartbeat(self):
+            lost = set(self.queue.heartbeat(self.name, list(self._jobs.values())))
+            for tid, jid in list(self._jobs.items()):
+                if jid in lost:
+                    # аренду перехватил другой узел — останавливаем свой процесс, но файлы не трогаем:
+                    # те же .part теперь докачивает он
+                    del self._jobs[tid]
+                    self.manager.detach(tid)  # и из очереди / ожидания повтора тоже
+                    print(f"[{self.name}] задание {jid} потеряно (аренда истекла)", flush=True)
+
+        def _on_status(self, d: dict):
+            status = d.get("status", "")
+            jid = self._jobs.get(d["id"])
+            if jid is None or not status.startswith(TERMINAL):
+                return
+            del self._jobs[d["id"]]
+            t = self.manager._tasks.get(d["id"])
+            if status.startswith("Готово"):
+                self.queue.complete(self.name, jid, t.path if t else "", t.tot_mb if t else None)
+            elif status.startswith("Ошибка"):
+                # сетевые и «хостовые» ошибки может не повторить другой узел (другой IP/канал),
+                # локальные (нет ffmpeg, кончился диск) — узел с другим окружением
+                kind = t.error_kind if t else ""
+                self.queue.fail(self.name, jid, status, retry=kind in HOST_FAILURES or kind == LOCAL)
+            else:
+                self.queue.release(self.name, [jid])
+            print(f"[{self.name}] задание {jid}: {status}", flush=True)
+            self._fill()
+
+        def stop(self):
+            self._poll.stop()
+            self._beat.stop()
+            # пауза, а не отмена: .part и фрагменты остаются, и узел, который возьмёт
+            # задание следующим, докачает их с --continue
+            for tid in list(self._jobs):
+                self.manager.detach(tid)
+            self.queue.release(self.name, list(self._jobs.values()))
+            self._jobs.clear()
+            self.manager.shutdown()
+
+    return Node
+
+
+def cmd_run(a) -> int:
+    from PySide6.QtCore import QCoreApplication
+    from app import load_config
+    from workers import DownloadManager
+
+    cfg = load_config()
+    import session
+    sess = session.configure(Path(__file__).parent / cfg["cookies_file"] if cfg.get("cookies_file") else None,
+                             cfg.get("cookies_domain", ""))
+    if sess.unbound:
+        print(f"куки из {cfg['cookies_file']} заданы строкой заголовка без домена и не используются — "
+              f"укажи cookies_domain в config.json", flush=True)
+    app = QCoreApplication(sys.argv[:1])
+    manager = DownloadManager(a.max_concurrent or cfg["max_concurrent"], cfg["concurrent_fragments"],
+                              prefetch_depth=0, policy="fifo")
+    node = _node_class()(JobQueue(a.queue, lease=a.lease), manager, a.out or cfg["out_dir"])
+    # Ctrl+C: вернуть взятые задания в очередь, а не ждать истечения аренды
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    print(f"[{node.name}] узел запущен, очередь {a.queue}", flush=True)
+    node._fill()
+    rc = app.exec()
+    node.stop()
+    return rc
+
+
+def cmd_submit(a) -> int:
+    q = JobQueue(a.queue)
+    for url in a.urls:
+        print(q.submit(url, a.out or "", "", a.height))
+    return 0
+
+
+def cmd_status(a) -> int:
+    q = JobQueue(a.queue)
+    print("  ".join(f"{k}: {v}" for k, v in sorted(q.counts().items())) or "очередь пуста")
+    for state in ("done", "failed"):
+        for r in q.results(state, a.limit):
+            print(f"{r['id']:>6}  {state:6}  {r['owner'] or '':24}  {r['path'] or r['error'] or ''}")
+    return 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Распределённая загрузка через общую очередь")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("run", "submit", "status"):
+        p = sub.add_parser(name)
+        p.add_argument("--queue", required=True, type=Path, help="файл SQLite общей очереди")
+        if name == "run":
+            p.add_argument("--out", help="папка загрузок (по умолчанию из config.json)")
+            p.add_argument("--max-concurrent", type=int, default=0)
+            p.add_argument("--lease", type=float, default=60.0, help="срок аренды задания, с")
+            p.set_defaults(fn=cmd_run)
+        elif name == "submit":
+            p.add_argument("--out", help="папка загрузок для этих заданий (иначе — папка узла)")
+            p.add_argument("--height", type=int)
+            p.add_argument("urls", nargs="+")
+            p.set_defaults(fn=cmd_submit)
+        else:
+            p.add_argument("--limit", type=int, default=20)
+            p.set_defaults(fn=cmd_status)
+    a = ap.parse_args(argv)
+    return a.fn(a)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
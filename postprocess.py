@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import os, struct, subprocess, sys, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from tools import find_ffmpeg
+
+
+def moov_first(path: str) -> Optional[bool]:
+    """True, если индекс (moov) стоит до данных (mdat); None — не MP4 или не разобрать."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                hdr = f.read(8)
+                if len(hdr) < 8:
+                    return None
+                size, kind = struct.unpack(">I4s", hdr)
+                if kind == b"moov":
+                    return True
+                if kind == b"mdat":
+                    return False
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0] - 8
+                elif size == 0:
+                    return None
+                f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def _process(ffmpeg: str, path: str, title: str, thumb: Optional[str]) -> Dict[str, Any]:
+    # выполняется в отдельном процессе: только копирование потоков, без перекодирования видео
+    t0 = time.perf_counter()
+    first = moov_first(path)
+    if first is None:
+        return {"ok": False, "skipped": True, "seconds": 0.0, "error": "не MP4"}
+    if first and not title and not thumb:
+        return {"ok": True, "skipped": True, "seconds": time.perf_counter() - t0, "error": ""}
+    tmp = path + ".pp"
+    cmd = [ffmpeg, "-y", "-hide_banner", "-loglevel", "error", "-i", path]
+    if thumb:
+        cmd += ["-i", thumb]
+    cmd += ["-map", "0:v:0?", "-map", "0:a?"]
+    if thumb:
+        # обложка — отдельный видеопоток attached_pic; webp/png переводим в jpeg (один кадр)
+        cmd += ["-map", "1:v:0", "-c", "copy", "-c:v:1", "mjpeg", "-disposition:v:1", "attached_pic"]
+    else:
+        cmd += ["-c", "copy"]
+    if title:
+        cmd += ["-metadata", f"title={title}"]
+    cmd += ["-movflags", "+faststart", "-f", "mp4", tmp]
+    try:
+        r = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                           encoding="utf-8", errors="replace",
+                           creationflags=subprocess.CREATE_NO_WINDOW if sys.platform.startswith("win") else 0)
+        if r.returncode != 0:
+            lines = (r.stderr or "").strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"ffmpeg rc={r.returncode}")
+        os.replace(tmp, path)
+    except Exception as e:
+        try: os.unlink(tmp)
+        except OSError: pass
+        return {"ok": False, "skipped": False, "seconds": time.perf_counter() - t0, "error": str(e)}
+    return {"ok": True, "skipped": False, "seconds": time.perf_counter() - t0, "error": ""}
+
+
+class PostProcessor:
+    """Faststart-ремукс и метаданные для готовых MP4 в пуле процессов.
+
+    После ``--merge-output-format mp4`` индекс ``moov`` часто оказывается в
+    конце файла, и плеер (или PreviewServer) читает файл целиком до начала
+    воспроизведения. ffmpeg копированием потоков переносит индекс вперёд и
+    заодно вшивает обложку и название.
+
+    Работа упирается в диск, а не в CPU: сверх ``workers`` процессов на
+    один физический диск одновременно пускается не больше ``per_disk``
+    задач — иначе параллельные копии только дерутся за головку/очередь.
+    """
+
+    def __init__(self, workers: int = 2, per_disk: int = 1,
+                 on_done: Optional[Callable[[int, Dict[str, Any]], None]] = None):
+        self.workers = max(1, int(workers))
+        self.per_disk = max(1, int(per_disk))
+        self.on_done = on_done
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._disks: Dict[int, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._ffmpeg: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        if self._ffmpeg is None:
+            self._ffmpeg = find_ffmpeg() or ""
+        return bool(self._ffmpeg)
+
+    def submit(self, tid: int, path: str, title: str = "", thumb: Optional[str] = None) -> bool:
+        """Поставить файл в обработку; False — обрабатывать нечего или нечем.
+
+        ``title`` — только настоящее название из метаданных: подпись карточки
+        («—», ссылка) в файл не вшиваем.
+        """
+        if not path or not path.lower().endswith((".mp4", ".m4v")) or not self.available:
+            return False
+        threading.Thread(target=self._run, args=(tid, path, title, thumb), daemon=True).start()
+        return True
+
+    def _disk(self, path: str) -> threading.Semaphore:
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            dev = -1
+        with self._lock:
+            sem = self._disks.get(dev)
+            if sem is None:
+                sem = self._disks[dev] = threading.Semaphore(self.per_disk)
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return sem
+
+    def _run(self, tid: int, path: str, title: str, thumb: Optional[str]):
+        sem = self._disk(path)
+        waited = time.perf_counter()
+        with sem:
+            waited = time.perf_counter() - waited
+            try:
+                res = self._pool.submit(_process, self._ffmpeg, path, title, thumb).result()
+            except Exception as e:
+                res = {"ok": False, "skipped": False, "seconds": 0.0, "error": str(e)}
+        res["waited"] = waited
+        if thumb:
+            try: Path(thumb).unlink()
+            except Exception: pass
+        if self.on_done:
+            self.on_done(tid, res)
+
+    def shutdown(self):
+        """Остановить пул при выходе, не дожидаясь идущих ремуксов.
+
+        Иначе atexit-хук ``concurrent.futures`` ждёт их, и процесс живёт после
+        закрытия окна. Прерванный ffmpeg пишет только во временный ``.pp`` —
+        исходный файл остаётся целым.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            procs = list((getattr(pool, "_processes", None) or {}).values())  # shutdown() их обнуляет
+            pool.shutdown(wait=False, cancel_futures=True)
+            for p in procs:
+                try: p.terminate()
+                except Exception: pass
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Локальный HTTP-сервер «смотреть во время загрузки».
+
+Отдаёт растущий файл ещё не докачанной задачи:
+
+* один поток (progressive MP4 / HLS, склеенный в .part) — файл читается
+  «хвостом» по мере роста; ``Range`` поддерживается в пределах того, что уже
+  на диске, а закрытые диапазоны ждут, пока нужные байты докачаются;
+* раздельные видео и аудио (DASH) — ffmpeg на лету склеивает их
+  копированием потоков в Matroska; без ffmpeg отдаётся только видео.
+  Сами файлы ffmpeg не открывает: каждый поток он читает у этого же
+  сервера (``/<token>/<task>/<n>``) тем же хвостовым чтением.
+
+Файлы не держатся открытыми между чтениями, чтобы не мешать yt-dlp
+переименовывать .part и удалять исходники после слияния (Windows).
+"""
+import secrets, subprocess, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from tools import find_ffmpeg
+
+# task_id -> ([пути потоков], загрузка ещё идёт) или None
+SourceFn = Callable[[int], Optional[Tuple[List[str], bool]]]
+
+CHUNK = 256 * 1024
+CONTENT_TYPES = {".mp4": "video/mp4", ".m4v": "video/mp4", ".m4a": "audio/mp4", ".ts": "video/mp2t",
+                 ".webm": "video/webm", ".mkv": "video/x-matroska", ".mp3": "audio/mpeg"}
+
+
+def _current(path: str) -> Path:
+    # пока формат качается — это .part, потом yt-dlp переименует его в итоговое имя
+    p = Path(path)
+    part = p.with_name(p.name + ".part")
+    return part if part.exists() else p
+
+
+def _size(path: str) -> int:
+    try:
+        return _current(path).stat().st_size
+    except OSError:
+        return 0
+
+
+def _read(path: str, offset: int, n: int) -> bytes:
+    try:
+        with _current(path).open("rb") as f:
+            f.seek(offset)
+            return f.read(n)
+    except OSError:
+        return b""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "PHPreview/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) not in (2, 3) or parts[0] != self.server.token or not parts[1].isdigit():
+            return self.send_error(404)
+        src = self.server.source(int(parts[1]))
+        if not src or not src[0]:
+            return self.send_error(404, "Поток ещё не начался")
+        paths, _ = src
+        tid = int(parts[1])
+        try:
+            if len(parts) == 3:
+                # отдельный поток задачи — так его читает ffmpeg из _remux
+                if not parts[2].isdigit() or int(parts[2]) >= len(paths):
+                    return self.send_error(404)
+                self._file(tid, paths[int(parts[2])])
+            elif len(paths) > 1 and self.server.ffmpeg:
+                self._remux(tid, len(paths[:2]))
+            else:
+                self._file(tid, paths[0])
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+
+    def _active(self, tid: int) -> bool:
+        src = self.server.source(tid)
+        return bool(src and src[1])
+
+    def _growing(self, tid: int, path: str) -> bool:
+        # поток DASH докачан, как только yt-dlp переименовал его .part в итоговое имя, —
+        # задача при этом ещё активна (качается второй поток)
+        p = Path(path)
+        done = p.exists() and not p.with_name(p.name + ".part").exists()
+        return not done and self._active(tid)
+
+    def _file(self, tid: int, path: str):
+        ctype = CONTENT_TYPES.get(Path(path).suffix.lower(), "application/octet-stream")
+        growing = self._growing(tid, path)
+        size = _size(path)
+        rng = self.headers.get("Range", "")
+        start, end = 0, None
+        if rng.startswith("bytes="):
+            a, _, b = rng[6:].split(",")[0].partition("-")
+            try:
+                start = int(a) if a else max(0, size - int(b))
+                end = int(b) if a and b else None
+            except ValueError:
+                return self.send_error(416)
+
+        if not growing:
+            # файл готов — обычная отдача диапазонов
+            if start >= size:
+                self.send_response(416); self.send_header("Content-Range", f"bytes */{size}"); self.end_headers()
+                return
+            end = size - 1 if end is None else min(end, size - 1)
+            self.send_response(206 if rng else 200)
+            if rng:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.send_header("Content-Type", ctype)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            return self._pump(tid, path, start, end)
+
+        if end is None and start > 0:
+            # открытый диапазон посреди растущего файла — отдаём то, что уже скачано
+            if start >= size:
+                self.send_response(416); self.send_header("Content-Range", "bytes */*"); self.end_headers()
+                return
+            end = size - 1
+        if end is not None:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/*")
+            self.send_header("Content-Length", str(end - start + 1))
+        else:
+            # с начала и без длины — «живой» поток до конца загрузки (HTTP/1.0, закрытие соединения)
+            self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self._pump(tid, path, start, end)
+
+    def _pump(self, tid: int, path: str, pos: int, end: Optional[int]):
+        # читаем файл хвостом; закрытый диапазон ждёт байты, открытый — конец загрузки
+        while end is None or pos <= end:
+            n = CHUNK if end is None else min(CHUNK, end - pos + 1)
+            data = _read(path, pos, n)
+            if data:
+                self.wfile.write(data)
+                pos += len(data)
+                continue
+            if not self._growing(tid, path) and _size(path) <= pos:
+                break
+            time.sleep(0.25)
+        self.wfile.flush()
+
+    def _remux(self, tid: int, n: int):
+        # входы — через этот же сервер, а не file:: с -follow ffmpeg держал бы .part открытым
+        # всё время просмотра, и yt-dlp на Windows не смог бы его переименовать
+        base = f"http://127.0.0.1:{self.server.server_address[1]}/{self.server.token}/{tid}"
+        cmd = [self.server.ffmpeg, "-hide_banner", "-loglevel", "error"]
+        for i in range(n):
+            # rw_timeout (мкс) — выйти, если поток перестал расти
+            cmd += ["-rw_timeout", "30000000", "-i", f"{base}/{i}"]
+        cmd += ["-map", "0:v:0?", "-map", "1:a:0?", "-c", "copy", "-f", "matroska", "pipe:1"]
+        proc = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform.startswith("win") else 0,
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "video/x-matroska")
+        self.end_headers()
+        try:
+            while True:
+                data = proc.stdout.read(CHUNK)
+                if not data:
+                    break
+                self.wfile.write(data)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+
+class PreviewServer:
+    """Сервер на 127.0.0.1 со случайным портом; поднимается при первом ``url_for``."""
+
+    def __init__(self, source: SourceFn):
+        self.source = source
+        self._srv: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+
+    def url_for(self, task_id: int) -> str:
+        with self._lock:
+            if self._srv is None:
+                srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+                srv.daemon_threads = True
+                srv.source = self.source
+                srv.token = secrets.token_urlsafe(8)  # чтобы чужие процессы не угадывали адрес
+                srv.ffmpeg = find_ffmpeg()
+                threading.Thread(target=srv.serve_forever, daemon=True).start()
+                self._srv = srv
+            return f"http://127.0.0.1:{self._srv.server_address[1]}/{self._srv.token}/{task_id}"
+
+    def stop(self):
+        with self._lock:
+            if self._srv:
+                self._srv.shutdown()
+                self._srv.server_close()
+                self._srv = None
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import random, re, threading, time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# ---------- Классы ошибок ----------
+TRANSIENT = "transient"        # сеть: таймауты, обрывы, 5xx
+RATE_LIMITED = "rate_limited"  # 429 / всплески 403 от CDN
+GEO_AUTH = "geo_auth"          # гео-блок, логин, возраст
+EXTRACTOR = "extractor"        # сломался экстрактор yt-dlp
+PERMANENT = "permanent"        # видео удалено / URL не поддерживается
+LOCAL = "local"                # проблема этой машины: нет ffmpeg, постобработка, диск
+
+ERROR_LABELS = {
+    TRANSIENT: "сеть",
+    RATE_LIMITED: "лимит запросов",
+    GEO_AUTH: "гео/авторизация",
+    EXTRACTOR: "экстрактор",
+    PERMANENT: "недоступно",
+    LOCAL: "локальная ошибка",
+}
+
+RETRYABLE = {TRANSIENT, RATE_LIMITED}
+# ошибки, которые говорят о проблеме хоста, а не конкретного видео
+HOST_FAILURES = {TRANSIENT, RATE_LIMITED, EXTRACTOR}
+
+# порядок важен: первое совпадение выигрывает
+_RULES = [
+    (LOCAL, re.compile(
+        r"ffmpeg (?:is )?not found|ffprobe (?:is )?not found|--ffmpeg-location|"
+        r"Postprocessing:|Conversion failed|No space left on device|Permission denied|"
+        r"Disk quota exceeded|Errno 28|Errno 13|unable to (?:open|write|rename) file", re.I)),
+    (GEO_AUTH, re.compile(
+        r"not available (?:in|from) your (?:country|location)|geo.?restrict|"
+        r"sign in|log ?in|login required|authenticat|cookies|age.?(?:restrict|gate|verif)|"
+        r"private video|premium|HTTP Error 401", re.I)),
+    (RATE_LIMITED, re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit|HTTP Error 403", re.I)),
+    (PERMANENT, re.compile(
+        r"Unsupported URL|video (?:is )?unavailable|has been (?:removed|disabled|deleted|terminated)|"
+        r"does not exist|no longer available|"
+        r"HTTP Error 404|HTTP Error 410|Requested format is not available", re.I)),
+    (EXTRACTOR, re.compile(
+        r"Unable to extract|please report this issue|ExtractorError|KeyError|"
+        r"Unable to parse|No video formats found", re.I)),
+    (TRANSIENT, re.compile(
+        r"timed? ?out|Connection (?:reset|refused|aborted)|Remote end closed|"
+        r"IncompleteRead|Temporary failure|Name or service not known|getaddrinfo|"
+        r"HTTP Error 5\d\d|Unable to download (?:webpage|JSON)|giving up after|"
+        r"SSL|EOF occurred", re.I)),
+]
+
+
+def classify_error(rc: int, output: str) -> str:
+    """Разложить неудачный запуск yt-dlp по классам по коду выхода и хвосту вывода."""
+    if rc == 127:   # yt-dlp не найден
+        return PERMANENT
+    if rc == 2:     # ошибка в аргументах командной строки
+        return PERMANENT
+    # в выводе интересны прежде всего строки ERROR:, но правила проверяем и по всему хвосту
+    errors = "\n".join(l for l in output.splitlines() if "ERROR" in l or "error" in l)
+    for text in (errors, output):
+        if not text:
+            continue
+        for kind, rx in _RULES:
+            if rx.search(text):
+                return kind
+    # yt-dlp объяснил причину, но мы её не знаем — повтор вряд ли поможет, и хост тут ни при чём
+    if "ERROR:" in output or "Traceback" in output:
+        return PERMANENT
+    # текста ошибки нет: процесс убит сигналом или оборвался — считаем сетевым сбоем
+    return TRANSIENT
+
+
+def backoff_delay(attempt: int, kind: str = TRANSIENT, base: float = 2.0, cap: float = 300.0) -> float:
+    """Экспоненциальная задержка с джиттером: половина фиксированная, половина случайная."""
+    if kind == RATE_LIMITED:
+        base *= 4  # CDN троттлит — ждём заметно дольше
+    d = min(cap, base * (2 ** max(0, attempt - 1)))
+    return d / 2 + random.uniform(0, d / 2)
+
+
+def host_of(url: str) -> str:
+    try:
+        host = (urlparse(url.strip()).hostname or "").lower()
+    except Exception:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+# ---------- Circuit breaker ----------
+class CircuitBreaker:
+    """Пер-хостовый предохранитель.
+
+    После ``threshold`` подряд неудач хост «размыкается» на ``cooldown`` секунд
+    (каждое повторное размыкание удваивает паузу до ``max_cooldown``). По
+    истечении паузы пропускается одна пробная загрузка: успех замыкает цепь,
+    неудача снова размыкает её.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 600.0):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self.max_cooldown = float(max_cooldown)
+        self._fails: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._trips: Dict[str, int] = {}
+        self._trial: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        """Можно ли стартовать загрузку на хост. В полуоткрытом состоянии резервирует пробу."""
+        with self._lock:
+            until = self._open_until.get(host)
+            if until is None:
+                return True
+            if time.monotonic() < until or self._trial.get(host):
+                return False
+            self._trial[host] = True
+            return True
+
+    def is_open(self, host: str) -> bool:
+        """Хост сейчас закрыт (пауза не истекла или уже идёт пробная загрузка). Ничего не резервирует."""
+        with self._lock:
+            until = self._open_until.get(host)
+            if until is None:
+                return False
+            return bool(time.monotonic() < until or self._trial.get(host))
+
+    def retry_after(self, host: str) -> Optional[float]:
+        """Сколько секунд хост ещё будет закрыт (None — не закрыт)."""
+        with self._lock:
+            until = self._open_until.get(host)
+            if until is None or self._trial.get(host):
+                return None
+            return max(0.0, until - time.monotonic())
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._fails.pop(host, None)
+            self._open_until.pop(host, None)
+            self._trips.pop(host, None)
+            self._trial.pop(host, None)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            n = self._fails.get(host, 0) + 1
+            self._fails[host] = n
+            if n < self.threshold and not self._trial.get(host):
+                return
+            trips = self._trips.get(host, 0)
+            self._trips[host] = trips + 1
+            pause = min(self.max_cooldown, self.cooldown * (2 ** trips))
+            self._open_until[host] = time.monotonic() + pause
+            self._trial.pop(host, None)
+
+    def release(self, host: str):
+        """Пробная загрузка не дошла до результата (пауза/отмена) — вернуть право на пробу."""
+        with self._lock:
+            self._trial.pop(host, None)
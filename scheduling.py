@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, List, Optional
+
+Task = Any  # tasks.Task или dict-снимок — политики читают поля через t.get()/t[...]
+
+
+def eta_seconds(eta: str) -> Optional[float]:
+    # "MM:SS" / "HH:MM:SS" из прогресса yt-dlp → секунды
+    try:
+        parts = [int(p) for p in (eta or "").split(":")]
+    except ValueError:
+        return None
+    if not parts:
+        return None
+    sec = 0
+    for p in parts:
+        sec = sec * 60 + p
+    return float(sec)
+
+
+def _fmt_size_mb(f: Dict[str, Any], duration: Optional[float]) -> Optional[float]:
+    b = f.get("filesize") or f.get("filesize_approx")
+    if not b and f.get("tbr") and duration:
+        b = f["tbr"] * 1000 / 8 * duration  # tbr — кбит/с
+    return b / 2 ** 20 if b else None
+
+
+def expected_size_mb(meta: Dict[str, Any], height: Optional[int] = None) -> Optional[float]:
+    """Ожидаемый размер загрузки по метаданным yt-dlp (видео + аудио), МБ."""
+    duration = meta.get("duration")
+    if height is None:
+        # yt-dlp уже посчитал размер выбранных по умолчанию форматов
+        top = _fmt_size_mb(meta, duration)
+        if top:
+            return top
+    fmts = meta.get("formats") or []
+    video = [f for f in fmts if f.get("vcodec") != "none"
+             and (height is None or (f.get("height") or 0) <= height)]
+    audio = [f for f in fmts if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")]
+    if not video:
+        return None
+    v = max(video, key=lambda f: (f.get("height") or 0, f.get("tbr") or 0))
+    size = _fmt_size_mb(v, duration)
+    if size is None:
+        return None
+    if v.get("acodec") == "none" and audio:
+        a = max(audio, key=lambda f: f.get("abr") or f.get("tbr") or 0)
+        size += _fmt_size_mb(a, duration) or 0.0
+    return size
+
+
+def remaining_seconds(t: Task, speed_mbs: float) -> Optional[float]:
+    """Сколько ещё качать задачу: живой ETA, иначе остаток/скорость, иначе ожидаемый размер/скорость."""
+    eta = eta_seconds(t.get("eta", ""))
+    if eta is not None:
+        return eta
+    spd = t.get("spd_mbs") or speed_mbs
+    if spd and spd > 0:
+        if t.get("tot_mb"):
+            return max(0.0, t["tot_mb"] - t.get("dl_mb", 0.0)) / spd
+        if t.get("expected_mb"):
+            return t["expected_mb"] / spd
+    return None
+
+
+def _cost(t: Task, speed_mbs: float) -> Optional[float]:
+    # единая «стоимость» задачи: секунды, если знаем скорость, иначе мегабайты
+    # (при speed_mbs <= 0 порядок по секундам и по МБ совпадает)
+    sec = remaining_seconds(t, speed_mbs)
+    if sec is not None:
+        return sec
+    if t.get("tot_mb"):
+        return max(0.0, t["tot_mb"] - t.get("dl_mb", 0.0))
+    return t.get("expected_mb")
+
+
+# ---------- Политики ----------
+class FifoPolicy:
+    """Как раньше: в порядке очереди."""
+    name = "fifo"
+
+    def order(self, tasks: List[Task], speed_mbs: float) -> List[Task]:
+        return list(tasks)
+
+    def started(self, t: Task, speed_mbs: float):
+        pass
+
+
+class ShortestFirstPolicy:
+    """Сначала самые короткие по ожидаемому времени — минимизирует среднее время завершения.
+
+    Задачи без оценки размера ставятся как «средние» среди известных.
+    """
+    name = "sjf"
+
+    def order(self, tasks: List[Task], speed_mbs: float) -> List[Task]:
+        costs = [_cost(t, speed_mbs) for t in tasks]
+        known = [c for c in costs if c is not None]
+        avg = sum(known) / len(known) if known else 0.0
+        idx = sorted(range(len(tasks)), key=lambda i: (avg if costs[i] is None else costs[i], i))
+        return [tasks[i] for i in idx]
+
+    def started(self, t: Task, speed_mbs: float):
+        pass
+
+
+class FairSharePolicy:
+    """Взвешенная справедливая очередь по классам размера.
+
+    Каждый класс (мелкие/средние/крупные) копит «виртуальное время» —
+    ожидаемую стоимость уже запущенных задач, делённую на вес класса.
+    Следующей стартует голова класса с наименьшим виртуальным временем,
+    поэтому мелкие ролики идут чаще, но крупные гарантированно двигаются.
+    """
+    name = "fair"
+    CLASSES = ((100.0, "small", 4.0), (1024.0, "medium", 2.0), (float("inf"), "large", 1.0))
+
+    def __init__(self):
+        self._vtime: Dict[str, float] = {}
+        self._floor = 0.0
+
+    def _class(self, t: Task) -> tuple:
+        size = t.get("tot_mb") or t.get("expected_mb")
+        if not size:
+            return self.CLASSES[1]
+        for limit, name, weight in self.CLASSES:
+            if size < limit:
+                return limit, name, weight
+        return self.CLASSES[-1]
+
+    def _charge(self, t: Task, speed_mbs: float) -> float:
+        _, _, weight = self._class(t)
+        return max(1.0, _cost(t, speed_mbs) or 0.0) / weight
+
+    def order(self, tasks: List[Task], speed_mbs: float) -> List[Task]:
+        # симуляция выбора на копии состояния — сам order() ничего не меняет
+        heads: Dict[str, List[Task]] = {}
+        for t in tasks:
+            heads.setdefault(self._class(t)[1], []).append(t)
+        vtime = {c: max(self._vtime.get(c, 0.0), self._floor) for c in heads}
+        out = []
+        while heads:
+            c = min(heads, key=lambda k: vtime[k])
+            t = heads[c].pop(0)
+            out.append(t)
+            vtime[c] += self._charge(t, speed_mbs)
+            if not heads[c]:
+                del heads[c]
+        return out
+
+    def started(self, t: Task, speed_mbs: float):
+        c = self._class(t)[1]
+        v = max(self._vtime.get(c, 0.0), self._floor)
+        self._floor = v  # простаивавший класс не копит «кредит» впрок
+        self._vtime[c] = v + self._charge(t, speed_mbs)
+
+
+POLICIES = {p.name: p for p in (FifoPolicy, ShortestFirstPolicy, FairSharePolicy)}
+POLICY_LABELS = {"fifo": "По очереди", "sjf": "Сначала короткие", "fair": "Справедливо по размеру"}
+
+
+def make_policy(name: str):
+    return POLICIES.get(name, FifoPolicy)()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import os, tempfile, threading
+from http.cookiejar import Cookie, LoadError, MozillaCookieJar
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# один UA для yt-dlp и для своих запросов: часть антибот-кук привязана к User-Agent
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
+COOKIES_PATH = Path(__file__).parent / "cookies.txt"
+POOL_SIZE = 8  # keep-alive соединений на хост
+
+
+def _cookie_domain(domain: str) -> str:
+    # "example.com" / ".example.com" / "https://example.com/" → ".example.com" (и поддомены)
+    host = (urlsplit(domain).hostname if "//" in domain else domain.strip().strip("/")) or ""
+    host = host.lstrip(".").lower()
+    if "." not in host or host.replace(".", "").isdigit() or ":" in host:
+        return host  # localhost / IP — куки только для самого хоста
+    return "." + host
+
+
+def _cookie(domain: str, name: str, value: str) -> Cookie:
+    return Cookie(0, name, value, None, False, domain, True, domain.startswith("."), "/", True,
+                  False, None, False, None, None, {})
+
+
+class Session:
+    """Общая авторизованная сессия: cookie jar + User-Agent + пул соединений.
+
+    Куки читаются из ``cookies.txt`` один раз. Поддерживается формат Netscape
+    (как у yt-dlp и браузерных расширений) и строка заголовка ``Cookie:``
+    (``a=1; b=2``). В строке заголовка нет домена, поэтому такие куки
+    привязываются к ``domain`` (ключ ``cookies_domain`` в настройках); пока он
+    не задан, они не отправляются никуда — угадывать сайт по первой ссылке
+    значит отдать чужие сессионные куки другому сайту.
+
+    Каждый процесс yt-dlp получает свой снимок jar во временном файле
+    (``ytdlp_args``): yt-dlp дописывает в него обновлённые сервером куки, и
+    после выхода процесса ``absorb`` сливает в общий jar только куки, которые
+    процесс добавил или изменил относительно выданного снимка, и атомарно
+    перезаписывает ``cookies.txt`` — нетронутый снимок одной загрузки не
+    откатывает куки, обновлённые тем временем другой. Собственные запросы (превью) идут через один
+    ``requests.Session`` с тем же jar и keep-alive пулом на хост.
+    """
+
+    def __init__(self, path=COOKIES_PATH, user_agent: str = USER_AGENT, domain: str = ""):
+        self.path = Path(path) if path else None
+        self.user_agent = user_agent
+        self.domain = _cookie_domain(domain) if domain else ""
+        self.jar = MozillaCookieJar()
+        self.unbound: Dict[str, str] = {}  # куки из строки заголовка без cookies_domain — не отправляются
+        self._lock = threading.Lock()
+        self._http = None
+        self._handed: Dict[str, set] = {}  # снимок -> подписи кук, выданных в него
+        self._load()
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            self.jar.load(str(self.path), ignore_discard=True, ignore_expires=True)
+            return
+        except (LoadError, OSError):
+            pass
+        try:
+            text = self.path.read_text(encoding="utf-8").strip()
+        except OSError:
+            return
+        if text.lower().startswith("cookie:"):
+            text = text[7:]
+        for part in text.split(";"):
+            name, eq, value = part.strip().partition("=")
+            if eq and name:
+                if self.domain:
+                    # файл перезапишем (уже в формате Netscape), только когда сервер сменит куки
+                    self.jar.set_cookie(_cookie(self.domain, name, value))
+                else:
+                    self.unbound[name] = value
+
+    @staticmethod
+    def _sig(c: Cookie) -> tuple:
+        return (c.domain, c.path, c.name, c.value, c.expires)
+
+    def _signature(self) -> set:
+        return {self._sig(c) for c in self.jar}
+
+    def _save(self):
+        # под self._lock: весь файл целиком во временный рядом и os.replace
+        if not self.path:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.jar.save(str(tmp), ignore_discard=True, ignore_expires=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            try: tmp.unlink()
+            except OSError: pass
+
+    # --- yt-dlp ---
+    def ytdlp_args(self, url: str) -> Tuple[List[str], Optional[str]]:
+        """Аргументы для yt-dlp и путь временного снимка кук (передать потом в ``absorb``)."""
+        args = ["--user-agent", self.user_agent]
+        with self._lock:
+            cookies = list(self.jar)
+        if not cookies:
+            return args, None
+        fd, tmp = tempfile.mkstemp(prefix="ph_cookies_", suffix=".txt")  # 0600 — куки не для чужих глаз
+        os.close(fd)
+        snap = MozillaCookieJar()
+        for c in cookies:
+            snap.set_cookie(c)
+        try:
+            snap.save(tmp, ignore_discard=True, ignore_expires=False)
+        except OSError:
+            return args, None
+        with self._lock:
+            self._handed[tmp] = {self._sig(c) for c in cookies}
+        return args + ["--cookies", tmp], tmp
+
+    def absorb(self, tmp: Optional[str]):
+        """Забрать куки, обновлённые процессом yt-dlp, и удалить снимок."""
+        if not tmp:
+            return
+        with self._lock:
+            handed = self._handed.pop(tmp, set())
+        snap = MozillaCookieJar()
+        try:
+            snap.load(tmp, ignore_discard=True, ignore_expires=False)
+        except (LoadError, OSError):
+            snap = None
+        try: os.unlink(tmp)
+        except OSError: pass
+        if snap is None:
+            return
+        with self._lock:
+            before = self._signature()
+            for c in snap:
+                if self._sig(c) not in handed:  # только то, что сменил сам процесс
+                    self.jar.set_cookie(c)
+            if self._signature() != before:
+                self._save()
+
+    # --- свои HTTP-запросы ---
+    def get(self, url: str, timeout: float = 10.0):
+        """GET через общий requests.Session (куки, UA, keep-alive)."""
+        with self._lock:
+            before = self._signature()
+            if self._http is None:
+                import requests  # тяжёлый импорт — только когда реально нужен
+                from requests.adapters import HTTPAdapter
+                s = requests.Session()
+                s.cookies = self.jar
+                s.headers["User-Agent"] = self.user_agent
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                self._http = s
+            http = self._http
+        r = http.get(url, timeout=timeout)
+        with self._lock:
+            if self._signature() != before:
+                self._save()  # сервер сменил куки — сохраняем сразу
+        return r
+
+
+_session: Optional[Session] = None
+_session_lock = threading.Lock()
+
+
+def configure(path, domain: str = "") -> Session:
+    """Задать файл кук и домен для кук из строки заголовка (из настроек).
+
+    Следующая ``get_session()`` вернёт новую сессию.
+    """
+    global _session
+    with _session_lock:
+        _session = Session(path, domain=domain)
+        return _session
+
+
+def get_session() -> Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = Session()
+        return _session
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import builtins, sys, time
+from typing import Dict, List, Optional
+
+
+class StartupProfile:
+    """Замер холодного старта для ``app.py --profile-startup``.
+
+    Перехватывает ``__import__`` и считает для каждого впервые загружаемого
+    модуля полное и «собственное» (без вложенных импортов) время, а также
+    отметки этапов запуска. Отчёт печатается в stderr.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks: List[tuple] = []
+        self.imports: Dict[str, List[float]] = {}  # name -> [cumulative, self]
+        self._stack: List[float] = []               # время детей для текущих импортов
+        self._orig = None
+
+    def start(self):
+        self._orig = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self):
+        if self._orig:
+            builtins.__import__ = self._orig
+            self._orig = None
+
+    def mark(self, label: str):
+        self.marks.append((label, time.perf_counter() - self.t0))
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._orig(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        t = time.perf_counter()
+        try:
+            return self._orig(name, globals, locals, fromlist, level)
+        finally:
+            cum = time.perf_counter() - t
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cum
+            rec = self.imports.setdefault(name, [0.0, 0.0])
+            rec[0] += cum
+            rec[1] += cum - children
+
+    def report(self, top: int = 15, out=None):
+        out = out or sys.stderr
+        print("--- startup ---", file=out)
+        prev = 0.0
+        for label, t in self.marks:
+            print(f"{t * 1000:8.1f} ms  (+{(t - prev) * 1000:6.1f})  {label}", file=out)
+            prev = t
+        print(f"--- imports (top {top} by self time, ms) ---", file=out)
+        rows = sorted(self.imports.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+        for name, (cum, own) in rows:
+            print(f"{own * 1000:8.1f} self {cum * 1000:8.1f} cum  {name}", file=out)
+        out.flush()
+
+
+def profile_from_argv(argv: List[str]) -> Optional[StartupProfile]:
+    if "--profile-startup" not in argv:
+        return None
+    argv.remove("--profile-startup")
+    prof = StartupProfile()
+    prof.start()
+    return prof
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, Optional
+
+
+class Task:
+    """Компактная запись задачи загрузки с маской изменённых полей.
+
+    Поля меняются только через ``update()`` / ``set_progress()`` /
+    ``set_metrics()`` — они отмечают бит поля в маске, если значение
+    действительно поменялось. ``delta()`` забирает изменения: возвращает
+    ``{"id", "v", <изменённые поля>}`` и поднимает версию, так что
+    потребитель может применять дельты по порядку, не копируя запись целиком.
+    Чтение — как у словаря (``t["status"]``, ``t.get("eta")``), чтобы
+    политики планирования и UI работали с ней так же, как со снимком.
+    """
+
+    FIELDS = ("url", "out_dir", "title", "height", "progress", "status", "path", "host",
+              "attempts", "error_kind", "priority", "expected_mb",
+              "dl_mb", "tot_mb", "spd_mbs", "eta")
+    __slots__ = ("id", "version", "_mask") + FIELDS
+    _BITS = {f: 1 << i for i, f in enumerate(FIELDS)}
+    _PROGRESS = _BITS["progress"]
+    _DL, _TOT, _SPD, _ETA = _BITS["dl_mb"], _BITS["tot_mb"], _BITS["spd_mbs"], _BITS["eta"]
+
+    def __init__(self, tid: int, url: str, out_dir: str, title: str, height: Optional[int],
+                 host: str = "", priority: bool = False, expected_mb: Optional[float] = None):
+        self.id = tid
+        self.version = 0
+        self._mask = 0
+        self.url, self.out_dir, self.title, self.height = url, out_dir, title, height
+        self.progress, self.status, self.path, self.host = 0, "queued", "", host
+        self.attempts, self.error_kind = 0, ""
+        self.priority, self.expected_mb = priority, expected_mb
+        self.dl_mb, self.tot_mb, self.spd_mbs, self.eta = 0.0, 0.0, 0.0, ""
+
+    # --- чтение как у dict ---
+    def __getitem__(self, name: str) -> Any:
+        return getattr(self, name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return getattr(self, name, default)
+
+    # --- запись с отметкой изменений ---
+    def update(self, **fields):
+        mask = self._mask
+        for k, v in fields.items():
+            if getattr(self, k) != v:
+                setattr(self, k, v)
+                mask |= self._BITS[k]
+        self._mask = mask
+
+    def set_progress(self, prog: int):
+        # горячий путь — без kwargs
+        if self.progress != prog:
+            self.progress = prog
+            self._mask |= self._PROGRESS
+
+    def set_metrics(self, dl: float, tot: float, spd: float, eta: str):
+        # горячий путь; в дельту — только реально изменившиеся поля (tot/eta часто стоят на месте)
+        mask = self._mask
+        if self.dl_mb != dl:
+            self.dl_mb = dl; mask |= self._DL
+        if self.tot_mb != tot:
+            self.tot_mb = tot; mask |= self._TOT
+        if self.spd_mbs != spd:
+            self.spd_mbs = spd; mask |= self._SPD
+        if self.eta != eta:
+            self.eta = eta; mask |= self._ETA
+        self._mask = mask
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._mask)
+
+    def delta(self) -> Optional[Dict[str, Any]]:
+        """Изменённые с прошлого вызова поля (и новая версия) или None."""
+        mask = self._mask
+        if not mask:
+            return None
+        self._mask = 0
+        self.version += 1
+        d = {"id": self.id, "v": self.version}
+        for f in self.FIELDS:
+            if mask & self._BITS[f]:
+                d[f] = getattr(self, f)
+        return d
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Полная копия текущего состояния (для task_added); маску не трогает."""
+        d = {"id": self.id, "v": self.version}
+        for f in self.FIELDS:
+            d[f] = getattr(self, f)
+        return d
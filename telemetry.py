@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import json, os, threading, time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logs import JsonlSink
+
+# фазы жизни задачи в порядке обычного прохождения
+PHASES = ("queued", "extract", "transfer", "merge", "cleanup", "postprocess", "backoff", "paused")
+QUANTILES = (0.5, 0.95)
+
+
+class TaskTimeline:
+    """Спаны фаз одной задачи + счётчики загрузки."""
+
+    __slots__ = ("tid", "spans", "phase", "since", "created", "first_byte",
+                 "bytes", "peak_mbs", "retries", "fragments", "prefetched")
+
+    def __init__(self, tid: int, now: float):
+        self.tid = tid
+        self.spans: List[tuple] = []   # (phase, start, end) — unix time
+        self.phase: Optional[str] = None
+        self.since = now
+        self.created = now
+        self.first_byte: Optional[float] = None
+        self.bytes = 0.0               # МБ
+        self.peak_mbs = 0.0
+        self.retries = 0
+        self.fragments = 0
+        self.prefetched = False
+
+    def enter(self, phase: str, now: float):
+        if self.phase == phase:
+            return
+        if self.phase is not None:
+            self.spans.append((self.phase, self.since, now))
+        self.phase, self.since = phase, now
+        if phase == "transfer" and self.first_byte is None:
+            self.first_byte = now
+
+    def close(self, now: float):
+        self.enter(None, now)
+
+    def durations(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for phase, a, b in self.spans:
+            out[phase] = out.get(phase, 0.0) + (b - a)
+        return out
+
+    def summary(self) -> Dict[str, Any]:
+        d = self.durations()
+        transfer = d.get("transfer", 0.0)
+        return {
+            "task": self.tid,
+            "spans": [{"phase": p, "start": round(a, 3), "end": round(b, 3)} for p, a, b in self.spans],
+            "durations": {k: round(v, 3) for k, v in d.items()},
+            "ttfb": round(self.first_byte - self.created, 3) if self.first_byte else None,
+            "total": round((self.spans[-1][2] if self.spans else self.since) - self.created, 3),
+            "mb": round(self.bytes, 3),
+            "avg_mbs": round(self.bytes / transfer, 3) if transfer > 0 else None,
+            "peak_mbs": round(self.peak_mbs, 3),
+            "retries": self.retries,
+            "fragments": self.fragments,
+            "prefetched": self.prefetched,
+        }
+
+
+def _quantile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    i = min(len(s) - 1, max(0, int(round(q * (len(s) - 1)))))
+    return s[i]
+
+
+class Telemetry:
+    """Сбор спанов по задачам и выгрузка метрик.
+
+    ``events_path`` — JSONL-журнал событий (смена фазы, итог задачи), копится
+    между запусками с ротацией по размеру; при первой выгрузке из него
+    подтягивается окно итогов, так что p50/p95 считаются не только по текущей
+    сессии. ``prom_path`` — файл в текстовом формате Prometheus (для
+    textfile-коллектора node_exporter), перезаписывается атомарно после каждой
+    завершённой задачи.
+
+    Вызывающий поток диск не ждёт: события пишет ``JsonlSink``, метрики —
+    отдельный поток, которому ``finish`` только сообщает, что они устарели.
+    """
+
+    def __init__(self, events_path: Optional[Path] = None, prom_path: Optional[Path] = None, window: int = 1000,
+                 events_max_bytes: int = 20 * 2 ** 20, events_backups: int = 2):
+        self.events_path = Path(events_path) if events_path else None
+        self.prom_path = Path(prom_path) if prom_path else None
+        self._sink = JsonlSink(self.events_path, events_max_bytes, events_backups) if self.events_path else None
+        self._live: Dict[int, TaskTimeline] = {}
+        self._done: deque = deque(maxlen=window)   # итоги задач для квантилей
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._started = time.time()  # итоги раньше этого момента — история прошлых запусков
+        self._history_loaded = False  # журнал читаем лениво — не на пути старта окна
+        self._prom_dirty = False
+        self._prom_thread: Optional[threading.Thread] = None
+
+    # --- события ---
+    def phase(self, tid: int, phase: str):
+        now = time.time()
+        with self._lock:
+            tl = self._live.get(tid)
+            if tl is None:
+                tl = self._live[tid] = TaskTimeline(tid, now)
+            if tl.phase == phase:
+                return
+            tl.enter(phase, now)
+        self._emit({"ts": round(now, 3), "event": "phase", "task": tid, "phase": phase})
+
+    def sample(self, tid: int, dl_mb: float, spd_mbs: float):
+        # горячий путь прогресса: только пара присваиваний под локом
+        with self._lock:
+            tl = self._live.get(tid)
+            if tl is not None:
+                tl.bytes = max(tl.bytes, dl_mb)
+                if spd_mbs > tl.peak_mbs:
+                    tl.peak_mbs = spd_mbs
+
+    def note(self, tid: int, **fields):
+        # retries / fragments / prefetched
+        with self._lock:
+            tl = self._live.get(tid)
+            if tl is not None:
+                for k, v in fields.items():
+                    setattr(tl, k, v)
+
+    def finish(self, tid: int, status: str, mb: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            tl = self._live.pop(tid, None)
+            if tl is None:
+                return None
+            if mb:
+                tl.bytes = max(tl.bytes, mb)
+            tl.close(now)
+            rec = tl.summary()
+            rec["status"] = status
+            self._done.append(rec)
+            self._count(f'phloader_tasks_total{{status="{status}"}}', 1)
+            self._count("phloader_bytes_total", rec["mb"] * 2 ** 20)
+            self._count("phloader_retries_total", rec["retries"])
+            self._count("phloader_fragments_total", rec["fragments"])
+            for phase, sec in rec["durations"].items():
+                self._count(f'phloader_phase_seconds_total{{phase="{phase}"}}', sec)
+        self._emit(dict(ts=round(now, 3), event="task_done", **rec))
+        self._kick_prometheus()
+        return rec
+
+    def snapshot(self, tid: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            tl = self._live.get(tid)
+            return tl.summary() if tl else None
+
+    # --- агрегаты ---
+    def _count(self, key: str, v: float):
+        self._counters[key] = self._counters.get(key, 0.0) + v
+
+    def prometheus_text(self) -> str:
+        self._load_history()
+        with self._lock:
+            counters = dict(self._counters)
+            done = [r for r in self._done if r.get("status") == "done"]
+            live = len(self._live)
+        ttfb = [r["ttfb"] for r in done if r.get("ttfb") is not None]
+        thr = [r["avg_mbs"] for r in done if r.get("avg_mbs")]
+        lines = [
+            "# HELP phloader_tasks_total Finished tasks by status.",
+            "# TYPE phloader_tasks_total counter",
+        ]
+        lines += [f"{k} {v:g}" for k, v in sorted(counters.items()) if k.startswith("phloader_tasks_total")]
+        for name, help_ in (("phloader_bytes_total", "Downloaded bytes."),
+                            ("phloader_retries_total", "Automatic retries."),
+                            ("phloader_fragments_total", "Downloaded fragments.")):
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} counter", f"{name} {counters.get(name, 0.0):g}"]
+        lines += ["# HELP phloader_phase_seconds_total Time spent in each task phase.",
+                  "# TYPE phloader_phase_seconds_total counter"]
+        lines += [f"{k} {v:.3f}" for k, v in sorted(counters.items()) if k.startswith("phloader_phase_seconds_total")]
+        for name, help_, vals in (("phloader_ttfb_seconds", "Time from enqueue to first byte.", ttfb),
+                                  ("phloader_throughput_mbs", "Average transfer speed per task, MB/s.", thr)):
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} summary"]
+            lines += [f'{name}{{quantile="{q}"}} {_quantile(vals, q):.3f}' for q in QUANTILES]
+            lines += [f"{name}_sum {sum(vals):.3f}", f"{name}_count {len(vals)}"]
+        lines += ["# HELP phloader_tasks_active Tasks with an open timeline.",
+                  "# TYPE phloader_tasks_active gauge", f"phloader_tasks_active {live}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        if not self.prom_path:
+            return
+        text = self.prometheus_text()
+        with self._io_lock:
+            try:
+                tmp = self.prom_path.with_suffix(self.prom_path.suffix + ".tmp")
+                tmp.write_text(text, encoding="utf-8")
+                os.replace(tmp, self.prom_path)
+            except Exception:
+                pass
+
+    def _kick_prometheus(self):
+        # пометить метрики устаревшими; пишет их один фоновый поток, сколько бы задач ни закончилось
+        if not self.prom_path:
+            return
+        with self._lock:
+            self._prom_dirty = True
+            if self._prom_thread is None:
+                self._prom_thread = threading.Thread(target=self._prom_loop, name="metrics", daemon=True)
+                self._prom_thread.start()
+
+    def _prom_loop(self):
+        while True:
+            with self._lock:
+                if not self._prom_dirty:
+                    self._prom_thread = None
+                    return
+                self._prom_dirty = False
+            self.write_prometheus()
+
+    # --- JSONL ---
+    def _emit(self, event: Dict[str, Any]):
+        if self._sink:
+            self._sink.put(event)
+
+    def _load_history(self):
+        if self._history_loaded:
+            return
+        self._history_loaded = True
+        if not self.events_path:
+            return
+        # старые файлы ротации — первыми, чтобы итоги шли по времени
+        files = [self.events_path.with_name(f"{self.events_path.name}.{i}")
+                 for i in range(self._sink.backups if self._sink else 0, 0, -1)] + [self.events_path]
+        hist = []
+        for path in files:
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        if '"task_done"' not in line:
+                            continue
+                        try:
+                            rec = json.loads(line)
+                        except Exception:
+                            continue
+                        # итоги этой сессии уже в self._done (и могут ещё не дойти до файла)
+                        if rec.get("ts", 0) < self._started:
+                            hist.append(rec)
+            except OSError:
+                continue
+        with self._lock:
+            self._done = deque(hist + list(self._done), maxlen=self._done.maxlen)
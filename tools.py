@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Поиск внешних программ, общих для нескольких модулей (без тяжёлых импортов)."""
+import shutil
+from pathlib import Path
+from typing import Optional
+
+FFMPEG_NAMES = ["ffmpeg.exe", "ffmpeg"]
+
+
+def find_ffmpeg() -> Optional[str]:
+    for name in FFMPEG_NAMES:
+        p = Path(__file__).parent / name
+        if p.exists():
+            return str(p)
+    for name in FFMPEG_NAMES:
+        p = shutil.which(name)
+        if p:
+            return p
+    return None
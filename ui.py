@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
-from PySide6.QtCore import Qt, QTimer, QRectF, QSize
-from PySide6.QtGui import QPixmap, QFont, QPainter, QColor, QPen, QIcon
+from PySide6.QtCore import Qt, QTimer, QRectF, QSize, QUrl
+from PySide6.QtGui import QPixmap, QFont, QPainter, QColor, QPen, QIcon, QDesktopServices
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
-    QFileDialog, QProgressBar, QTextEdit, QFrame, QComboBox, QStackedWidget,
-    QMessageBox, QSizePolicy, QSpinBox
+    QFileDialog, QProgressBar, QPlainTextEdit, QFrame, QComboBox, QStackedWidget,
+    QMessageBox, QSizePolicy, QSpinBox, QCheckBox
 )
 from pathlib import Path
 from workers import FetchMetaWorker, DownloadManager
+from scheduling import expected_size_mb, POLICY_LABELS
+from telemetry import Telemetry
+from logs import LogHub, JsonlSink
+import session
 import json
 import os, subprocess, sys
 
@@ -58,7 +62,6 @@ class TaskCard(QFrame):
         self.title.setObjectName("cardTitle") 
         self.title.setAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
         self.title.setWordWrap(True)
-        self.title.setFont(font)
         self.title.setStyleSheet("color:#ffffff;")
 
         self.badge = QLabel("MP4")
@@ -69,7 +72,10 @@ class TaskCard(QFrame):
         self.btn_delete.setVisible(False)
         self.btn_delete.setStyleSheet("QPushButton{background:#7a1f1f; border-color:#8a2a2a;} QPushButton:hover{background:#8a2a2a;}")
         self.btn_pause  = QPushButton("Пауза")
+        self.btn_play = QPushButton("Смотреть")  # предпросмотр ещё качающегося видео
         self.btn_cancel = QPushButton("Отмена")
+        self.btn_prio = QPushButton("Вперёд"); self.btn_prio.setCheckable(True)
+        self.btn_prio.setToolTip("Приоритет: стартует раньше и не останавливается при уменьшении числа загрузок")
         self.btn_show = QPushButton("Показать в папке")
         self.btn_show.setVisible(False)
         top = QHBoxLayout(self); top.setContentsMargins(12,12,12,12); top.setSpacing(12)
@@ -89,6 +95,8 @@ class TaskCard(QFrame):
         row_run = QHBoxLayout()
         row_run.addWidget(self.btn_pause)
         row_run.addWidget(self.btn_cancel)
+        row_run.addWidget(self.btn_prio)
+        row_run.addWidget(self.btn_play)
         row_run.addStretch(1)
         right.addLayout(row_run)
         self._row_run = row_run  # запомним, чтобы скрывать/показывать
@@ -102,9 +110,32 @@ class MainWin(QWidget):
         super().__init__()
         self.setWindowTitle("Download PH"); self.resize(1160, 760)
         self.cfg, self.cfg_path = cfg, cfg_path
+        sess = session.configure(cfg_path.parent / cfg["cookies_file"] if cfg.get("cookies_file") else None,
+                                 cfg.get("cookies_domain", ""))
+        sink = None
+        if cfg.get("app_log"):
+            sink = JsonlSink(cfg_path.parent / cfg["app_log"], int(cfg.get("log_max_mb", 5) * 2 ** 20),
+                             cfg.get("log_backups", 3))
+        self.logs = LogHub(ring=cfg.get("log_lines", 500), sink=sink)
+        if sess.unbound:
+            self.logs.warn(f"Куки из {cfg['cookies_file']} заданы строкой «Cookie:» без домена и не отправляются — "
+                           f"укажи сайт в cookies_domain (config.json).")
+        self._log_seq = 0
         self.manager = DownloadManager(
             max_concurrent=cfg.get("max_concurrent", 2),
             concurrent_fragments=cfg.get("concurrent_fragments", 16),
+            prefetch_depth=cfg.get("prefetch_depth", 2),
+            prefetch_concurrency=cfg.get("prefetch_concurrency", 1),
+            policy=cfg.get("schedule_policy", "fifo"),
+            telemetry=Telemetry(
+                events_path=cfg_path.parent / cfg.get("events_log", "events.jsonl"),
+                prom_path=cfg_path.parent / cfg.get("metrics_file", "metrics.prom"),
+            ),
+            log=self.logs,
+            postprocess=cfg.get("postprocess", False),
+            postprocess_workers=cfg.get("postprocess_workers", 2),
+            postprocess_per_disk=cfg.get("postprocess_per_disk", 1),
+            rate_limit_mbs=cfg.get("rate_limit_mbs", 0),
         )
         self._apply_theme()
 
@@ -126,8 +157,13 @@ class MainWin(QWidget):
         # content
         self.stack = QStackedWidget(); root.addWidget(self.stack, 1)
         self.page_main = QWidget(); self.stack.addWidget(self.page_main); self._build_tab_main(self.page_main)
-        self.page_downloads = QWidget(); self.stack.addWidget(self.page_downloads); self._build_tab_downloads(self.page_downloads)
-        self.page_settings = QWidget(); self.stack.addWidget(self.page_settings); self._build_tab_settings(self.page_settings)
+        self.page_downloads = QWidget(); self.stack.addWidget(self.page_downloads)
+        self.page_settings = QWidget(); self.stack.addWidget(self.page_settings)
+        # остальные вкладки строим при первом показе — окно появляется быстрее
+        self._page_builders = {
+            1: (self._build_tab_downloads, self.page_downloads),
+            2: (self._build_tab_settings, self.page_settings),
+        }
 
         # signals
         self.manager.task_added.connect(self._on_task_added)
@@ -136,14 +172,22 @@ class MainWin(QWidget):
         self.manager.task_status.connect(self._on_task_status)
 
         self._cards = {}; self._last_thumb_pixmap = None
+        self._preview = None  # PreviewServer — поднимаем при первом «Смотреть»
         self._last_prog = {}  # tid -> last %
         self.out_edit.setText(self.cfg.get("out_dir", str(Path.home() / "Downloads")))
         self._switch_page(0)
 
+    def closeEvent(self, e):
+        # пул постобработки и сервер превью сами не закроются — процесс висел бы после окна
+        self.manager.shutdown()
+        if self._preview is not None:
+            self._preview.stop()
+        super().closeEvent(e)
+
     def _apply_theme(self):
         self.setStyleSheet('''
             QWidget { background: #14171c; color: #e3e6eb; font-size: 14px; }
-            QLineEdit, QComboBox, QTextEdit { background: #1b1f26; border: 1px solid #2a313c; border-radius: 8px; padding: 6px 8px; }
+            QLineEdit, QComboBox, QPlainTextEdit { background: #1b1f26; border: 1px solid #2a313c; border-radius: 8px; padding: 6px 8px; }
             QProgressBar { background: #1b1f26; border: 1px solid #2a313c; border-radius: 6px; height: 16px; text-align: center; }
             QProgressBar::chunk { background: #3a6df0; border-radius: 6px; }
             QPushButton { background: #2a313c; border: 1px solid #3a4352; border-radius: 10px; padding: 8px 12px; }
@@ -164,11 +208,22 @@ class MainWin(QWidget):
         # восстановить значения при открытии
         self.def_out_edit.setText(self.cfg.get("out_dir", str(Path.home() / "Downloads")))
         self.spin_conc.setValue(int(self.cfg.get("max_concurrent", 2)))
+        self.spin_prefetch.setValue(int(self.cfg.get("prefetch_depth", 2)))
+        i = self.combo_policy.findData(self.cfg.get("schedule_policy", "fifo"))
+        self.combo_policy.setCurrentIndex(max(0, i))
+        self.chk_post.setChecked(bool(self.cfg.get("postprocess", False)))
+        self.spin_frag.setValue(int(self.cfg.get("concurrent_fragments", 16)))
+        self.spin_rate.setValue(int(self.cfg.get("rate_limit_mbs", 0)))
 
     def _save_cfg(self):
         # собрать и сохранить
         self.cfg["out_dir"] = self.def_out_edit.text().strip() or self.cfg.get("out_dir")
         self.cfg["max_concurrent"] = int(self.spin_conc.value())
+        self.cfg["prefetch_depth"] = int(self.spin_prefetch.value())
+        self.cfg["schedule_policy"] = self.combo_policy.currentData() or "fifo"
+        self.cfg["postprocess"] = self.chk_post.isChecked()
+        self.cfg["concurrent_fragments"] = int(self.spin_frag.value())
+        self.cfg["rate_limit_mbs"] = int(self.spin_rate.value())
         try:
             self.cfg_path.write_text(json.dumps(self.cfg, ensure_ascii=False, indent=2), encoding="utf-8")
         except Exception as e:
@@ -176,6 +231,12 @@ class MainWin(QWidget):
         # применить сразу в приложении
         self.out_edit.setText(self.cfg["out_dir"])
         self.manager.set_max_concurrent(self.cfg["max_concurrent"])
+        self.manager.set_prefetch_depth(self.cfg["prefetch_depth"])
+        self.manager.set_postprocess(self.cfg["postprocess"])
+        # фрагменты и скорость применяются и к уже идущим загрузкам (перезапуск с --continue)
+        self.manager.set_concurrent_fragments(self.cfg["concurrent_fragments"])
+        self.manager.set_rate_limit(self.cfg["rate_limit_mbs"])
+        self.manager.set_policy(self.cfg["schedule_policy"])
 
     
 
@@ -196,6 +257,16 @@ class MainWin(QWidget):
         else:
             subprocess.Popen(["xdg-open", str(p.parent)])
 
+    def _play(self, tid: int):
+        src = self.manager.preview_source(tid)
+        if not src or not src[0]:
+            QMessageBox.information(self, "Смотреть", "Загрузка ещё не началась.")
+            return
+        if self._preview is None:
+            from preview import PreviewServer
+            self._preview = PreviewServer(self.manager.preview_source)
+        QDesktopServices.openUrl(QUrl(self._preview.url_for(tid)))
+
     def _delete_file(self, tid:int):
         path = self._task_path(tid)
         if not path:
@@ -215,7 +286,14 @@ class MainWin(QWidget):
         self._update_counts()
 
     # --- pages ---
+    def _ensure_page(self, idx: int):
+        b = self._page_builders.pop(idx, None)
+        if b:
+            build, host = b
+            build(host)
+
     def _switch_page(self, idx: int):
+        self._ensure_page(idx)
         self.stack.setCurrentIndex(idx)
         for i, b in enumerate((self.btn_home, self.btn_downloads, self.btn_settings)):
             b.setChecked(i == idx)
@@ -264,13 +342,17 @@ class MainWin(QWidget):
         out_row.addWidget(QLabel("Качество:")); out_row.addWidget(self.quality_combo, 1); out_row.addSpacing(20)
         out_row.addWidget(QLabel("Расположение:")); out_row.addWidget(self.out_edit, 1); out_row.addWidget(self.btn_out)
         tl.addLayout(out_row)
-        self.log = QTextEdit(); self.log.setReadOnly(True); self.log.setMaximumHeight(100); tl.addWidget(self.log)
+        self.log_view = QPlainTextEdit(); self.log_view.setReadOnly(True); self.log_view.setMaximumHeight(100)
+        self.log_view.setMaximumBlockCount(self.cfg.get("log_lines", 500)); tl.addWidget(self.log_view)
+        # окно лога подтягивает новые записи из LogHub по таймеру, а не на каждую строку
+        self._log_timer = QTimer(self); self._log_timer.timeout.connect(self._drain_log); self._log_timer.start(300)
         root.addWidget(table_card)
         # meta fetch
         self._fetch_timer = QTimer(self); self._fetch_timer.setSingleShot(True)
         self._fetch_timer.timeout.connect(self.fetch_meta)
         self.url_edit.textChanged.connect(self._on_url_changed)
         self._current_title = "—"; self._available_heights = []; self._fetch_worker = None
+        self._current_meta = {}; self._current_thumb = b""; self._meta_url = ""
 
     def _build_tab_downloads(self, host: QWidget):
         root = QVBoxLayout(host); root.setSpacing(12); root.setContentsMargins(24,24,24,24)
@@ -321,6 +403,21 @@ class MainWin(QWidget):
         row2 = QHBoxLayout()
         self.spin_conc = QSpinBox(); self.spin_conc.setRange(1, 4); self.spin_conc.setValue(self.cfg.get("max_concurrent", 2))
         row2.addWidget(QLabel("Параллельные Загрузки:")); row2.addWidget(self.spin_conc); root.addLayout(row2)
+        row3 = QHBoxLayout()
+        self.spin_prefetch = QSpinBox(); self.spin_prefetch.setRange(0, 10); self.spin_prefetch.setValue(self.cfg.get("prefetch_depth", 2))
+        row3.addWidget(QLabel("Заранее извлекать (задач):")); row3.addWidget(self.spin_prefetch); root.addLayout(row3)
+        row4 = QHBoxLayout()
+        self.combo_policy = QComboBox()
+        for key, label in POLICY_LABELS.items(): self.combo_policy.addItem(label, userData=key)
+        row4.addWidget(QLabel("Порядок очереди:")); row4.addWidget(self.combo_policy); row4.addStretch(1); root.addLayout(row4)
+        row5 = QHBoxLayout()
+        self.spin_frag = QSpinBox(); self.spin_frag.setRange(1, 32)
+        self.spin_rate = QSpinBox(); self.spin_rate.setRange(0, 1000); self.spin_rate.setSpecialValueText("без ограничения")
+        row5.addWidget(QLabel("Фрагментов параллельно:")); row5.addWidget(self.spin_frag); row5.addSpacing(20)
+        row5.addWidget(QLabel("Скорость на загрузку, МБ/с:")); row5.addWidget(self.spin_rate); row5.addStretch(1)
+        root.addLayout(row5)
+        self.chk_post = QCheckBox("После загрузки: индекс в начало файла (faststart), обложка и название — нужен ffmpeg")
+        root.addWidget(self.chk_post)
         def save_settings():
             self.cfg["out_dir"] = self.def_out_edit.text().strip() or self.cfg["out_dir"]
             self.cfg["max_concurrent"] = int(self.spin_conc.value())
@@ -343,6 +440,11 @@ class MainWin(QWidget):
         btn.clicked.connect(pick_and_save)  # кнопка "Изменить" рядом с путём
 
         self.spin_conc.valueChanged.connect(lambda _=None: self._save_cfg())
+        self.spin_prefetch.valueChanged.connect(lambda _=None: self._save_cfg())
+        self.combo_policy.currentIndexChanged.connect(lambda _=None: self._save_cfg())
+        self.chk_post.toggled.connect(lambda _=None: self._save_cfg())
+        self.spin_frag.valueChanged.connect(lambda _=None: self._save_cfg())
+        self.spin_rate.valueChanged.connect(lambda _=None: self._save_cfg())
 
         # если оставляешь кнопку "Сохранить" — пусть дергает тот же метод
         btn_save.clicked.connect(self._save_cfg)
@@ -358,6 +460,8 @@ class MainWin(QWidget):
         if d: self.out_edit.setText(d)
 
     def _on_url_changed(self, _):
+        # метаданные прошлой ссылки больше не наши: иначе её название и обложка уйдут в чужой файл
+        self._current_title = "—"; self._current_meta = {}; self._current_thumb = b""; self._meta_url = ""
         self.loading_wrap.setVisible(True); self.loading_spinner.start(); self._fetch_timer.start(400)
 
     def fetch_meta(self):
@@ -370,8 +474,13 @@ class MainWin(QWidget):
         self._fetch_worker.start()
 
     def _on_meta_done(self, meta: dict, thumb_bytes: bytes, heights: list[int]):
+        url = getattr(self.sender(), "url", None)
+        if url != self.url_edit.text().strip():
+            return  # запоздалый ответ для ссылки, которой в поле уже нет
         self.loading_wrap.setVisible(False); self.loading_spinner.stop()
         self._current_title = meta.get("title") or "—"; self.title_lbl.setText(self._current_title)
+        self._current_meta = meta; self._meta_url = url
+        self._current_thumb = thumb_bytes or b""
         if thumb_bytes:
             p = QPixmap()
             if p.loadFromData(thumb_bytes):
@@ -386,46 +495,69 @@ class MainWin(QWidget):
         for h in sorted(set(heights), reverse=True): self.quality_combo.addItem(f"{h}p", userData=h)
 
     def _on_meta_error(self, msg: str):
+        if getattr(self.sender(), "url", None) != self.url_edit.text().strip():
+            return
         self.loading_wrap.setVisible(False); self.loading_spinner.stop()
         self.title_lbl.setText("—"); self.thumb_lbl.setText("Нет превью")
+        self._current_meta = {}; self._current_thumb = b""
         self.quality_combo.clear(); self.quality_combo.addItem("Авто (лучшее)", userData=None)
-        self.log.append(f"[!] Ошибка метаданных: {msg}")
+        self.logs.warn(f"Ошибка метаданных: {msg}")
+
+    def _drain_log(self):
+        recs = self.logs.since(self._log_seq)
+        if not recs:
+            return
+        self._log_seq = recs[-1][0]
+        self.log_view.appendPlainText("\n".join(
+            (f"[!] {msg}" if level in ("warn", "error") else msg) for _, _, level, _, msg in recs))
 
     def _selected_height(self):
         d = self.quality_combo.currentData()
         return int(d) if isinstance(d, int) else None
 
-    def add_to_queue(self):
+    def _enqueue_current(self, priority: bool):
         url = self.url_edit.text().strip()
         if not url:
-            self.log.append("[!] Вставь ссылку.")
-            return
+            self.logs.warn("Вставь ссылку.")
+            return None
         out_dir = self.out_edit.text().strip() or self.cfg.get("out_dir")
-        title = (self._current_title or "").strip() or url
-        tid = self.manager.enqueue(url, out_dir, title, self._selected_height())
-        self.log.append(f"Добавлено в очередь (#{tid}) — {title}")
-        self._switch_page(1)
+        h = self._selected_height()
+        # метаданные — только если получены именно для этой ссылки (yt-dlp -j мог ещё не ответить)
+        if self._meta_url == url:
+            meta, thumb = self._current_meta, self._current_thumb
+        else:
+            meta, thumb = {}, b""
+        title = (meta.get("title") or "").strip() or url
+        tid = self.manager.enqueue(url, out_dir, title, h, priority=priority,
+                                   expected_mb=expected_size_mb(meta, h) if meta else None,
+                                   thumb=thumb, meta_title=meta.get("title") or "")
+        return tid, title
+
+    def add_to_queue(self):
+        r = self._enqueue_current(priority=False)
+        if r:
+            self.logs.info(f"Добавлено в очередь (#{r[0]}) — {r[1]}", r[0])
+            self._switch_page(1)
 
 
     def download_now(self):
-        url = self.url_edit.text().strip()
-        if not url:
-            self.log.append("[!] Вставь ссылку.")
-            return
-        out_dir = self.out_edit.text().strip() or self.cfg.get("out_dir")
-        title = (self._current_title or "").strip() or url
-        tid = self.manager.enqueue(url, out_dir, title, self._selected_height(), priority=True)
-        self.log.append(f"Запущено (#{tid}) — {title}")
-        self._switch_page(1)
+        r = self._enqueue_current(priority=True)
+        if r:
+            self.logs.info(f"Запущено (#{r[0]}) — {r[1]}", r[0])
+            self._switch_page(1)
 
 
     # cards ui
     def _add_card(self, task):
+        self._ensure_page(1)
         card = TaskCard(task["id"], task.get("title") or "—")
         card.btn_pause.clicked.connect(lambda _, tid=task["id"]: self._toggle_pause(tid))
         card.btn_cancel.clicked.connect(lambda _, tid=task["id"]: self.manager.cancel(tid))
         card.btn_delete.clicked.connect(lambda _, tid=task["id"]: self._delete_file(tid))
         card.btn_show.clicked.connect(lambda _, tid=task["id"]: self._reveal_in_folder(tid))
+        card.btn_play.clicked.connect(lambda _, tid=task["id"]: self._play(tid))
+        card.btn_prio.setChecked(bool(task.get("priority")))
+        card.btn_prio.toggled.connect(lambda on, tid=task["id"]: self.manager.set_priority(tid, on))
 
         if self._last_thumb_pixmap:
             pm = self._last_thumb_pixmap.scaled(card.thumb.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
@@ -451,6 +583,8 @@ class MainWin(QWidget):
 
 
     def _update_counts(self):
+        if 1 in self._page_builders:  # вкладка загрузок ещё не построена
+            return
         q = sum(1 for c in self._cards.values() if getattr(c, "_phase", "q") == "q")
         d = sum(1 for c in self._cards.values() if getattr(c, "_phase", "") == "d")
         self.btn_tab_q.setText(f"Очередь ({q})")
@@ -481,7 +615,15 @@ class MainWin(QWidget):
             c.meta.setText(f"{dl_mb:.1f} MB / {tot_txt}  |  {spd_mbs:.2f} MB/s  |  ETA {eta}")
 
     def _on_task_status(self, task):
+        # приходит дельта: {"id", "v", <изменённые поля>}; карточке важны статус и приоритет
         c = self._cards.get(task["id"])
+        if c and "priority" in task:
+            # приоритет меняет и менеджер («Продолжить» ставит задачу первой) — без обратного set_priority
+            c.btn_prio.blockSignals(True)
+            c.btn_prio.setChecked(bool(task["priority"]))
+            c.btn_prio.blockSignals(False)
+        if "status" not in task:
+            return
         st = task.get("status","")
 
         if st == "Отменено":
@@ -518,6 +660,16 @@ class MainWin(QWidget):
                 c.meta.setText("Загрузка"); c.btn_pause.setEnabled(True); c.btn_pause.setText("Пауза")
             elif st.startswith("Ошибка") or st.startswith("error"):
                 c.meta.setText(st); c.btn_pause.setEnabled(False)
+                # последние строки yt-dlp — во всплывающей подсказке
+                tail = self.logs.tail(task["id"])
+                if tail: c.meta.setToolTip("\n".join(tail[-15:]))
+            elif st.startswith("Повтор"):
+                c.meta.setText(st); c.btn_pause.setEnabled(False)
+            elif st == "queued":
+                c.meta.setText("В очереди")
+            elif st == "Обработка":
+                c.progress.setValue(100); c.meta.setText("Обработка…")
+                c.btn_pause.setEnabled(False); c.btn_cancel.setEnabled(False)
 
         self._update_counts()
 
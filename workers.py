@@ -1,17 +1,42 @@
 # -*- coding: utf-8 -*-
-import json, re, shutil, subprocess, threading, signal, time, sys
+import glob, json, os, re, shutil, subprocess, threading, signal, time, sys, tempfile
+from collections import deque
+from functools import partial
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-import requests
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from PySide6.QtCore import QObject, Signal
+from retry import (classify_error, backoff_delay, host_of, CircuitBreaker,
+                   RETRYABLE, HOST_FAILURES, ERROR_LABELS)
+from scheduling import eta_seconds, expected_size_mb, make_policy
+from telemetry import Telemetry
+from logs import LogHub
+from postprocess import PostProcessor
+from session import get_session
+from tasks import Task
 
 YT_DLP_NAMES = ["yt-dlp.exe", "yt-dlp"]
+MIN_YT_DLP_VERSION = (2024, 8, 6)  # как в requirements.txt
+RECONFIG_DELAY = 1.0         # с — пауза перед перезапуском загрузок после смены настроек
+RECONFIG_MAX_PROGRESS = 95   # % — почти докачанные задачи не перезапускаем
+YT_DLP_CACHE = Path(__file__).parent / "ytdlp_cache.json"
 
-def find_yt_dlp() -> Optional[str]:
+_ytdlp_lock = threading.Lock()
+_ytdlp_memo: Optional[Dict[str, Any]] = None  # {"path", "mtime", "size", "version"}
+
+
+def _local_yt_dlp() -> Optional[str]:
+    # бинарник рядом со скриптом главнее PATH
     for name in YT_DLP_NAMES:
         p = Path(__file__).parent / name
         if p.exists():
             return str(p)
+    return None
+
+
+def _probe_yt_dlp() -> Optional[str]:
+    local = _local_yt_dlp()
+    if local:
+        return local
     for name in YT_DLP_NAMES:
         p = shutil.which(name)
         if p:
@@ -19,6 +44,111 @@ def find_yt_dlp() -> Optional[str]:
     return None
 
 
+def _stat_key(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def _ytdlp_version(path: str) -> Optional[str]:
+    try:
+        res = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=20,
+                             creationflags=subprocess.CREATE_NO_WINDOW if sys.platform.startswith("win") else 0)
+    except Exception:
+        return None
+    v = res.stdout.strip().splitlines()
+    return v[0] if res.returncode == 0 and v else None
+
+
+def _version_ok(version: str) -> bool:
+    try:
+        return tuple(int(x) for x in version.split(".")[:3]) >= MIN_YT_DLP_VERSION
+    except ValueError:
+        return True  # nightly/нестандартная сборка — не мешаем
+
+
+def _valid(rec: Optional[Dict[str, Any]]) -> bool:
+    # запись годна, пока бинарник на месте и не менялся (mtime+size) и рядом со скриптом
+    # не появился свой yt-dlp — он главнее найденного в PATH
+    if not rec or _stat_key(rec["path"]) != (rec.get("mtime"), rec.get("size")):
+        return False
+    local = _local_yt_dlp()
+    return not local or local == rec["path"]
+
+
+def find_yt_dlp() -> Optional[str]:
+    """Путь к yt-dlp.
+
+    Результат поиска и проверки версии кешируется в памяти и в ytdlp_cache.json:
+    повторный вызов — пара stat(), а новый запуск приложения не гоняет
+    ``shutil.which`` и ``yt-dlp --version``, пока бинарник не поменялся.
+    Версию старше ``MIN_YT_DLP_VERSION`` сообщает ``yt_dlp_outdated()``.
+    """
+    global _ytdlp_memo
+    env = os.environ.get("PH_YTDLP")  # явный путь (например, заглушка из bench/)
+    if env and Path(env).exists():
+        return env
+    memo = _ytdlp_memo
+    if _valid(memo):
+        return memo["path"]
+    with _ytdlp_lock:
+        if _valid(_ytdlp_memo):
+            return _ytdlp_memo["path"]
+        try:
+            rec = json.loads(YT_DLP_CACHE.read_text(encoding="utf-8"))
+        except Exception:
+            rec = None
+        if not _valid(rec):
+            rec = None
+            path = _probe_yt_dlp()
+            key = _stat_key(path) if path else None
+            version = _ytdlp_version(path) if key else None
+            if version:  # не запускается — считаем, что yt-dlp нет
+                rec = {"path": path, "mtime": key[0], "size": key[1], "version": version,
+                       "outdated": not _version_ok(version)}
+                try:
+                    YT_DLP_CACHE.write_text(json.dumps(rec), encoding="utf-8")
+                except Exception:
+                    pass
+        _ytdlp_memo = rec
+        return rec["path"] if rec else None
+
+
+def yt_dlp_outdated() -> Optional[str]:
+    """Версия найденного yt-dlp, если она старше MIN_YT_DLP_VERSION; иначе None.
+
+    Только смотрит в кеш ``find_yt_dlp`` — ничего не запускает.
+    """
+    rec = _ytdlp_memo
+    return rec["version"] if rec and rec.get("outdated") else None
+
+
+def extract_info(ytdlp: str, url: str) -> Dict[str, Any]:
+    """``yt-dlp -j`` → первый JSON-объект из вывода. При неудаче бросает RuntimeError."""
+    sess = get_session()
+    auth, jar = sess.ytdlp_args(url)
+    try:
+        res = subprocess.run(
+            [ytdlp, *auth, "-j", url],
+            capture_output=True, text=True, encoding="utf-8", errors="replace"
+        )
+    finally:
+        sess.absorb(jar)
+    if res.returncode != 0:
+        raise RuntimeError(f"yt-dlp -j вернул {res.returncode}:\n{res.stdout}\n{res.stderr}")
+    for line in res.stdout.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            return json.loads(line)
+        except Exception:
+            continue
+    raise RuntimeError("Не удалось распарсить метаданные.")
+
+
 # ---------- Загрузка метаданных ----------
 class FetchMetaWorker(QObject):
     done = Signal(dict, bytes, list)
@@ -37,26 +167,7 @@ class FetchMetaWorker(QObject):
             self.error.emit("yt-dlp не найден. Помести yt-dlp.exe рядом со скриптом или в PATH.")
             return
         try:
-            res = subprocess.run(
-                [ytdlp, "-j", self.url],
-                capture_output=True, text=True, encoding="utf-8", errors="replace"
-            )
-            if res.returncode != 0:
-                self.error.emit(f"yt-dlp -j вернул {res.returncode}:\n{res.stdout}\n{res.stderr}")
-                return
-            meta = None
-            for line in res.stdout.splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    meta = json.loads(line)
-                    break
-                except Exception:
-                    continue
-            if not meta:
-                self.error.emit("Не удалось распарсить метаданные.")
-                return
+            meta = extract_info(ytdlp, self.url)
 
             heights = sorted({
                 f.get("height") for f in meta.get("formats", [])
@@ -67,7 +178,7 @@ class FetchMetaWorker(QObject):
             thumb = meta.get("thumbnail")
             if thumb:
                 try:
-                    r = requests.get(thumb, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
+                    r = get_session().get(thumb, timeout=10)
                     r.raise_for_status()
                     thumb_bytes = r.content
                 except Exception:
@@ -77,6 +188,107 @@ class FetchMetaWorker(QObject):
             self.error.emit(str(e))
 
 
+# ---------- Предварительное извлечение ----------
+# параметры подписанных ссылок CDN с unix-временем истечения
+_RE_EXPIRY = re.compile(r"(?:[?&/;~](?:expire|expires|e|validto|exp)[=/])(\d{10})\b")
+
+def signed_url_expiry(meta: Dict[str, Any]) -> Optional[float]:
+    """Самый ранний срок жизни подписанных ссылок форматов (unix time) или None."""
+    best = None
+    for f in meta.get("formats") or [meta]:
+        for m in _RE_EXPIRY.finditer(f.get("url") or ""):
+            ts = float(m.group(1))
+            best = ts if best is None else min(best, ts)
+    return best
+
+
+class PreExtractor:
+    """Заранее вытягивает info.json для ближайших задач очереди.
+
+    Когда освобождается слот, задача стартует с ``--load-info-json`` и сразу
+    качает байты, не тратя время на извлечение. Готовый info.json считается
+    годным, пока не истекли подписанные ссылки форматов (или ``ttl``, если
+    срок из ссылок не виден), минус запас ``margin``.
+    """
+
+    def __init__(self, depth: int = 2, concurrency: int = 1, ttl: float = 300.0, margin: float = 60.0,
+                 on_ready: Optional[Callable[[int, Dict[str, Any]], None]] = None):
+        self.depth = max(0, int(depth))
+        self.on_ready = on_ready
+        self.ttl = float(ttl)
+        self.margin = float(margin)
+        self._sem = threading.Semaphore(max(1, int(concurrency)))
+        self._dir = Path(tempfile.gettempdir()) / "ph_loader_info"
+        self._entries: Dict[int, Dict[str, Any]] = {}  # tid -> {"state", "path", "expires"}
+        self._lock = threading.Lock()
+
+    def schedule(self, candidates: List[tuple]):
+        """candidates — [(tid, url)] задач, которые вероятно стартуют в пределах окна."""
+        now = time.time()
+        with self._lock:
+            for tid, url in candidates:
+                e = self._entries.get(tid)
+                if e and (e["state"] == "running" or e["expires"] - self.margin > now):
+                    continue
+                self._entries[tid] = {"state": "running", "path": None, "expires": now + self.ttl}
+                threading.Thread(target=self._run, args=(tid, url), daemon=True).start()
+
+    def take(self, tid: int) -> Optional[str]:
+        """Путь к свежему info.json для задачи (или None — пусть yt-dlp извлекает сам)."""
+        with self._lock:
+            e = self._entries.get(tid)
+            if not e or e["state"] != "ready":
+                return None
+            if e["expires"] - self.margin <= time.time():
+                self._drop(tid)
+                return None
+            return e["path"]
+
+    def discard(self, tid: int):
+        with self._lock:
+            self._drop(tid)
+
+    def _drop(self, tid: int):
+        e = self._entries.pop(tid, None)
+        if e and e["path"]:
+            try: Path(e["path"]).unlink()
+            except Exception: pass
+
+    def _run(self, tid: int, url: str):
+        with self._sem:
+            with self._lock:
+                if tid not in self._entries:  # задачу успели отменить/запустить
+                    return
+            ytdlp = find_yt_dlp()
+            path, expires = None, time.time() + self.ttl
+            try:
+                if not ytdlp:
+                    raise RuntimeError("yt-dlp не найден")
+                meta = extract_info(ytdlp, url)
+                exp = signed_url_expiry(meta)
+                if exp is not None:
+                    expires = min(expires, exp) if exp > time.time() else time.time()
+                self._dir.mkdir(parents=True, exist_ok=True)
+                path = self._dir / f"{tid}.info.json"
+                path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+                if self.on_ready:
+                    self.on_ready(tid, meta)
+            except Exception:
+                path = None
+        with self._lock:
+            e = self._entries.get(tid)
+            if e is None or e["state"] != "running":
+                if path:
+                    try: path.unlink()
+                    except Exception: pass
+                return
+            if path:
+                e.update(state="ready", path=str(path), expires=expires)
+            else:
+                # не вышло — повторим не раньше чем через ttl, а пока пусть качает как обычно
+                e.update(state="failed", expires=time.time() + self.ttl)
+
+
 # ---------- Основной загрузчик ----------
 class DownloadWorker(QObject):
     progress = Signal(int)
@@ -84,21 +296,28 @@ class DownloadWorker(QObject):
     finished = Signal(int, str, str)
     canceled = Signal(str)
     paused = Signal(str)  # <- добавили сигнал паузы
+    phase = Signal(str)   # transfer / merge / cleanup — для таймлайна задачи
 
-    def __init__(self, url: str, out_dir: str, title: str, height: int | None, concurrent_fragments: int = 16):
+    def __init__(self, url: str, out_dir: str, title: str, height: int | None, concurrent_fragments: int = 16,
+                 info_json: Optional[str] = None, tail_lines: int = 40,
+                 on_line: Optional[Callable[[str], None]] = None, rate_limit: float = 0.0):
         super().__init__()
         self.url = url.strip()
+        self.info_json = info_json  # заранее извлечённые метаданные (PreExtractor)
         self.out_dir = out_dir.strip()
         self.title = title
         self.height = height
         self.fragments = int(concurrent_fragments)
+        self.rate_limit = float(rate_limit or 0.0)  # МБ/с на загрузку, 0 — без ограничения
         self._proc: Optional[subprocess.Popen] = None
         self._cancel_flag = False
         self._dest_path: Optional[Path] = None
         self._part_path: Optional[Path] = None
         self._pause_flag = False  # <- добавили
-        # безопасный префикс имени для чистки хвостов
-        self._safe_prefix = "ph_" + "".join(ch for ch in (title or "") if ch.isalnum() or ch in " -_").strip()
+        self.tail: deque = deque(maxlen=tail_lines)  # последние строки вывода — для классификации и отчёта об ошибке
+        self.on_line = on_line  # вызывается из потока чтения для каждой строки, кроме прогресса
+        self.frag_count = 0  # сколько фрагментов у HLS/DASH-потоков (если есть)
+        self.streams: List[str] = []  # файлы форматов по мере начала их загрузки (для предпросмотра)
 
     def start(self):
         threading.Thread(target=self._run, daemon=True).start()
@@ -140,23 +359,19 @@ class DownloadWorker(QObject):
         
 
     def _cleanup_partial(self):
-        # удалить хвосты именно этого задания
-        try:
-            base = Path(self.out_dir)
-            patterns = [
-                f"{self._safe_prefix}*.part",
-                f"{self._safe_prefix}*.-Frag*",
-                f"{self._safe_prefix}*-Frag*",
-                f"{self._safe_prefix}*.ytdl",
-                f"{self._safe_prefix}*.tmp",
-                f"{self._safe_prefix}*.temp",
-            ]
-            for pat in patterns:
-                for fp in base.glob(pat):
-                    try: fp.unlink()
-                    except Exception: pass
-        except Exception:
-            pass
+        # удалить хвосты именно этого задания — только файлов, которые yt-dlp объявил в Destination:
+        # по префиксу имени можно задеть чужие загрузки в той же папке (другие задачи и узлы)
+        for dst in self.streams:
+            try:
+                p = Path(dst)
+                name = glob.escape(p.name)
+                for pat in (f"{name}.part", f"{name}.part-Frag*", f"{name}-Frag*",
+                            f"{name}.ytdl", f"{name}.tmp", f"{name}.temp"):
+                    for fp in p.parent.glob(pat):
+                        try: fp.unlink()
+                        except Exception: pass
+            except Exception:
+                pass
 
 
     def _run(self):
@@ -173,11 +388,15 @@ class DownloadWorker(QObject):
             fmt = "bestvideo+bestaudio/best"
 
         out_tmpl = str(Path(self.out_dir) / "ph_%(title)s.%(ext)s")
+        source = ["--load-info-json", self.info_json] if self.info_json else [self.url]
+        sess = get_session()
+        auth, jar = sess.ytdlp_args(self.url)  # те же куки и UA, что при извлечении
         cmd = [
-            ytdlp, self.url,
+            ytdlp, *source, *auth,
             "-f", fmt,
             "--merge-output-format", "mp4",
             "--concurrent-fragments", str(self.fragments),
+            *(["--limit-rate", f"{self.rate_limit:g}M"] if self.rate_limit > 0 else []),
             "--continue",                 # разрешаем докачку
             "--no-keep-fragments",        # удалит .*-Frag* при УСПЕШНОМ завершении
             "--newline",
@@ -193,15 +412,17 @@ class DownloadWorker(QObject):
         )
         re_dest = re.compile(r'\[download\]\s+Destination:\s+(?P<dst>.+)$')
         re_merge = re.compile(r'\[Merger\]\s+Merging formats into\s+"(?P<dst>.+)"')
+        re_post = re.compile(r'^\[(?:Merger|Fixup\w*|VideoRemuxer|VideoConvertor|ExtractAudio)\]')
+        re_frag = re.compile(r'\(frag \d+/(?P<n>\d+)\)|Total fragments:\s*(?P<t>\d+)')
+        cur_phase = ""
 
 
-        self._proc = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            text=True, encoding="utf-8", errors="replace",
-            creationflags=creationflags
-        )
-
         try:
+            self._proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                text=True, encoding="utf-8", errors="replace",
+                creationflags=creationflags
+            )
             while True:
                 line = self._proc.stdout.readline()
                 if self._pause_flag:
@@ -217,10 +438,22 @@ class DownloadWorker(QObject):
                     continue
 
                 s = line.rstrip("\n")
+                m = re_prog.search(s)
+                if not m:
+                    # строки прогресса не копим: иначе они вытесняют из хвоста сообщения об ошибке
+                    self.tail.append(s)
+                    if self.on_line:
+                        self.on_line(s)
+                if cur_phase != "merge" and re_post.search(s):
+                    cur_phase = "merge"; self.phase.emit(cur_phase)
+                mf = re_frag.search(s)
+                if mf:
+                    self.frag_count = max(self.frag_count, int(mf.group("n") or mf.group("t")))
                 md = re_dest.search(s)
                 if md:
                     try:
                         self._dest_path = Path(md.group("dst")).resolve()
+                        self.streams.append(str(self._dest_path))
                     except Exception:
                         pass
                 mm = re_merge.search(s)
@@ -230,9 +463,9 @@ class DownloadWorker(QObject):
                     except Exception:
                         pass
 
-
-                m = re_prog.search(s)
                 if m:
+                    if not cur_phase:
+                        cur_phase = "transfer"; self.phase.emit(cur_phase)
                     try:
                         pct = int(float(m.group(1)))
                         self.progress.emit(pct)
@@ -256,8 +489,14 @@ class DownloadWorker(QObject):
                         pass
 
             rc = self._proc.poll() or 0
+            if self._pause_flag:
+                # дождаться выхода: менеджер может сразу перезапустить задачу на тех же .part
+                try: self._proc.wait(timeout=10)
+                except Exception: pass
         finally:
             self._proc = None
+            sess.absorb(jar)
+        self.phase.emit("cleanup")
 
         if self._pause_flag:
             # не чистим фрагменты – позволим резюмировать
@@ -277,127 +516,538 @@ class DownloadWorker(QObject):
 
 # ---------- Менеджер ----------
 class DownloadManager(QObject):
-    task_added = Signal(dict)
+    # object, а не dict: Qt не гоняет словарь через QVariantMap (лишняя копия на каждый emit)
+    task_added = Signal(object)
     task_progress = Signal(int, int)
     task_metrics = Signal(int, float, float, float, str)
-    task_status = Signal(dict)
+    task_status = Signal(object)  # дельта: {"id", "v", <изменённые поля>} — см. Task.delta()
+    _wake = Signal()  # таймеры живут в своих потоках — воркеры создаём только в потоке менеджера
+    _postprocessed = Signal(int, object)  # из потока PostProcessor — в поток менеджера
+    _reconfig = Signal()  # отложенное применение настроек к активным загрузкам
 
-    def __init__(self, max_concurrent: int = 2, concurrent_fragments: int = 16):
+    def __init__(self, max_concurrent: int = 2, concurrent_fragments: int = 16, max_retries: int = 3,
+                 prefetch_depth: int = 2, prefetch_concurrency: int = 1, policy: str = "fifo",
+                 telemetry: Optional[Telemetry] = None, log: Optional[LogHub] = None,
+                 postprocess: bool = False, postprocess_workers: int = 2, postprocess_per_disk: int = 1,
+                 rate_limit_mbs: float = 0.0):
         super().__init__()
+        self.telemetry = telemetry or Telemetry()
+        self.log = log or LogHub()
         self.max_concurrent = max(1, int(max_concurrent))
         self.concurrent_fragments = concurrent_fragments
-        self._tasks: Dict[int, Dict[str, Any]] = {}
+        self.rate_limit_mbs = float(rate_limit_mbs or 0.0)
+        self.max_retries = max(0, int(max_retries))
+        self._tasks: Dict[int, Task] = {}
         self._queue: List[int] = []
         self._active: Dict[int, DownloadWorker] = {}
         self._next_id = 1
         self._lock = threading.Lock()
+        self._breaker = CircuitBreaker()
+        self._retry_timers: Dict[int, threading.Timer] = {}
+        self._wake_timer: Optional[threading.Timer] = None
+        self._prefetch = PreExtractor(prefetch_depth, prefetch_concurrency, on_ready=self._on_prefetched)
+        self._policy = make_policy(policy)
+        self._speed_mbs = 0.0  # сглаженная скорость одной загрузки — для оценки длительности
+        self._prefetch_at = 0.0
+        self._wake.connect(self._try_start_more)
+        self.postprocess = postprocess  # faststart + обложка/название после загрузки
+        self._post = PostProcessor(postprocess_workers, postprocess_per_disk,
+                                   on_done=lambda tid, res: self._postprocessed.emit(tid, res))
+        self._thumbs: Dict[int, str] = {}  # tid -> файл обложки для PostProcessor
+        self._meta_titles: Dict[int, str] = {}  # tid -> название из метаданных для PostProcessor
+        self._postprocessed.connect(self._on_postprocessed)
+        # активные загрузки, остановленные менеджером (не пользователем): перезапуск с новыми
+        # параметрами / возврат в очередь при уменьшении max_concurrent; .part остаются
+        self._restart: set = set()
+        self._suspend: set = set()
+        self._reconfig_timer: Optional[threading.Timer] = None
+        self._reconfig.connect(self._apply_worker_settings)
+        self._ytdlp_warned = False
 
     def set_max_concurrent(self, n: int):
-        self.max_concurrent = max(1, int(n))
+        with self._lock:
+            self.max_concurrent = max(1, int(n))
+            running = [tid for tid, w in self._active.items()
+                       if tid not in self._suspend and not w._pause_flag and not w._cancel_flag]
+            excess = len(running) - self.max_concurrent
+            if excess > 0:
+                # лишние — самые неприоритетные и наименее продвинувшиеся; вернутся в очередь первыми
+                running.sort(key=lambda tid: (self._tasks[tid].priority, self._tasks[tid].progress))
+                for tid in running[:excess]:
+                    self._restart.discard(tid)
+                    self._suspend.add(tid)
+                    self._active[tid].pause()
         self._try_start_more()
 
-    def enqueue(self, url: str, out_dir: str, title: str, height: Optional[int], priority: bool = False) -> int:
+    def set_concurrent_fragments(self, n: int):
+        self.concurrent_fragments = max(1, int(n))
+        self._schedule_reconfig()
+
+    def set_rate_limit(self, mbs: float):
+        self.rate_limit_mbs = max(0.0, float(mbs or 0.0))
+        self._schedule_reconfig()
+
+    def set_priority(self, task_id: int, on: bool):
+        with self._lock:
+            t = self._tasks.get(task_id)
+            if not t:
+                return
+            t.update(priority=bool(on))
+            d = t.delta()
+        self._emit_status(d)
+        self._try_start_more()
+
+    def _schedule_reconfig(self):
+        # спинбоксы дёргают сеттер на каждый шаг — перезапускаем загрузки один раз, когда значение устоится
+        if self._reconfig_timer:
+            self._reconfig_timer.cancel()
+        self._reconfig_timer = threading.Timer(RECONFIG_DELAY, self._reconfig.emit)
+        self._reconfig_timer.daemon = True
+        self._reconfig_timer.start()
+
+    def _apply_worker_settings(self):
+        # yt-dlp не меняет параметры на лету: останавливаем процесс и сразу запускаем заново
+        # с --continue — скачанное остаётся в .part/фрагментах
+        with self._lock:
+            for tid, w in self._active.items():
+                if tid in self._restart or tid in self._suspend or w._pause_flag or w._cancel_flag:
+                    continue
+                if self._tasks[tid].progress >= RECONFIG_MAX_PROGRESS:
+                    continue  # почти готово (или уже слияние) — перезапуск дороже, чем выигрыш
+                frags = w.fragments != self.concurrent_fragments and w.frag_count > 0
+                if frags or w.rate_limit != self.rate_limit_mbs:
+                    self._restart.add(tid)
+                    w.pause()
+
+    def set_policy(self, name: str):
+        policy = make_policy(name)
+        with self._lock:
+            # настройки сохраняются целиком — та же политика не должна терять накопленное
+            # состояние (виртуальное время fair)
+            if policy.name == self._policy.name:
+                return
+            self._policy = policy
+        self._plan_prefetch()
+
+    def set_prefetch_depth(self, n: int):
+        self._prefetch.depth = max(0, int(n))
+        self._plan_prefetch()
+
+    def set_postprocess(self, on: bool):
+        self.postprocess = bool(on)
+
+    def enqueue(self, url: str, out_dir: str, title: str, height: Optional[int], priority: bool = False,
+                expected_mb: Optional[float] = None, thumb: Optional[bytes] = None, meta_title: str = "") -> int:
+        # title — подпись карточки; meta_title — название из метаданных, его вшивает PostProcessor
         with self._lock:
             tid = self._next_id
             self._next_id += 1
-            t = {"id": tid, "url": url, "out_dir": out_dir, "title": title or "—",
-                 "height": height, "progress": 0, "status": "queued", "path": ""}
+            t = Task(tid, url, out_dir, title or "—", height, host=host_of(url),
+                     priority=priority, expected_mb=expected_mb)
             self._tasks[tid] = t
             if priority:
                 self._queue.insert(0, tid)
             else:
                 self._queue.append(tid)
-        self.task_added.emit(dict(t))
+            snap = t.snapshot()
+        if meta_title and self.postprocess:
+            self._meta_titles[tid] = meta_title
+        if thumb and self.postprocess:
+            try:
+                p = Path(tempfile.gettempdir()) / "ph_loader_info" / f"{tid}.thumb"
+                p.parent.mkdir(parents=True, exist_ok=True)
+                p.write_bytes(thumb)
+                self._thumbs[tid] = str(p)
+            except Exception:
+                pass
+        self.telemetry.phase(tid, "queued")
+        self.task_added.emit(snap)
         self._try_start_more()
         return tid
 
+    def _drop_thumb(self, tid: int):
+        self._meta_titles.pop(tid, None)
+        p = self._thumbs.pop(tid, None)
+        if p:
+            try: Path(p).unlink()
+            except Exception: pass
+
+    def _emit_status(self, d: Optional[Dict[str, Any]]):
+        if d:
+            self.task_status.emit(d)
+
     def cancel(self, task_id: int):
+        d = None
+        post: List[Callable[[], Any]] = []  # телеметрия пишет на диск — только после отпускания лока
         with self._lock:
+            self._restart.discard(task_id)
+            self._suspend.discard(task_id)
             if task_id in self._active:
-                self._tasks[task_id]["status"] = "canceling"
+                self._tasks[task_id].update(status="canceling")
                 w = self._active.get(task_id)
                 if w:
                     w.cancel()
             elif task_id in self._queue:
                 self._queue = [t for t in self._queue if t != task_id]
-                self._tasks[task_id]["status"] = "canceled"
-                self.task_status.emit(dict(self._tasks[task_id]))
-    
+                self._tasks[task_id].update(status="canceled")
+                self._prefetch.discard(task_id)
+                self._drop_thumb(task_id)
+                post.append(partial(self.telemetry.finish, task_id, "canceled"))
+                d = self._tasks[task_id].delta()
+            elif task_id in self._retry_timers:
+                # ждёт повтора — просто снимаем таймер
+                self._retry_timers.pop(task_id).cancel()
+                self._tasks[task_id].update(status="Отменено")
+                post.append(partial(self.telemetry.finish, task_id, "canceled"))
+                d = self._tasks[task_id].delta()
+        for fn in post:
+            fn()
+        self._emit_status(d)
+
     def pause(self, task_id: int):
         with self._lock:
+            # пауза пользователя главнее отложенного перезапуска/возврата в очередь менеджером
+            self._restart.discard(task_id)
+            self._suspend.discard(task_id)
             w = self._active.get(task_id)
             if w:
-                self._tasks[task_id]["status"] = "Пауза"
+                self._tasks[task_id].update(status="Пауза")
                 w.pause()
 
+    def shutdown(self):
+        """Выход из приложения: снять таймеры и остановить пул постобработки."""
+        with self._lock:
+            timers = list(self._retry_timers.values()) + [self._wake_timer, self._reconfig_timer]
+            self._retry_timers.clear()
+        for timer in timers:
+            if timer:
+                timer.cancel()
+        self._post.shutdown()
+
+    def detach(self, task_id: int):
+        """Остановить задачу в любом состоянии, не трогая её .part и фрагменты.
+
+        Для узла, у которого задание забрали (или который выключается): задача
+        не должна ни докачиваться, ни перезапускаться по таймеру повтора или из
+        очереди — те же файлы теперь пишет другой узел.
+        """
+        d = None
+        with self._lock:
+            t = self._tasks.get(task_id)
+            if not t:
+                return
+            self._restart.discard(task_id)
+            self._suspend.discard(task_id)
+            timer = self._retry_timers.pop(task_id, None)
+            if timer:
+                timer.cancel()
+            if task_id in self._queue:
+                self._queue.remove(task_id)
+            self._prefetch.discard(task_id)
+            w = self._active.get(task_id)
+            t.update(status="Пауза")
+            if w:
+                w.pause()  # дельту отправит _on_paused
+            else:
+                d = t.delta()
+        if d:
+            self.telemetry.phase(task_id, "paused")
+            self._emit_status(d)
+
     def resume(self, task_id: int):
         with self._lock:
             t = self._tasks.get(task_id)
-            if not t: return
+            if not t or task_id in self._active or task_id in self._queue: return
+            timer = self._retry_timers.pop(task_id, None)
+            if timer:
+                timer.cancel()
             # просто возвращаем задачу в очередь первой
             self._queue.insert(0, task_id)
-            t["status"] = "queued"
+            t.update(priority=True, status="queued")
+            d = t.delta()
+        self.telemetry.phase(task_id, "queued")
+        self._emit_status(d)
         self._try_start_more()
 
 
+    def preview_source(self, task_id: int) -> Optional[Tuple[List[str], bool]]:
+        """Файлы задачи для предпросмотра и флаг «ещё качается» (для PreviewServer)."""
+        with self._lock:
+            w = self._active.get(task_id)
+            if w is not None:
+                return list(w.streams), True
+            t = self._tasks.get(task_id)
+            if t is not None and t.path:
+                return [t.path], False
+        return None
+
+    def _ordered_queue(self) -> List[int]:
+        # порядок старта по текущей политике; приоритетные («Скачать сейчас», «Продолжить») —
+        # первыми, хосты под предохранителем пропускаем (под self._lock)
+        ready = [self._tasks[tid] for tid in self._queue
+                 if tid in self._tasks and not self._breaker.is_open(self._tasks[tid].host)]
+        urgent = [t.id for t in ready if t.priority]
+        rest = self._policy.order([t for t in ready if not t.priority], self._speed_mbs)
+        return urgent + [t.id for t in rest]
+
+    def _next_startable(self) -> Optional[int]:
+        # следующая задача к старту (под self._lock)
+        for tid in self._ordered_queue():
+            t = self._tasks[tid]
+            if self._breaker.allow(t.host):
+                self._queue.remove(tid)
+                self._policy.started(t, self._speed_mbs)
+                return tid
+        waits = [self._breaker.retry_after(self._tasks[tid].host) for tid in self._queue if tid in self._tasks]
+        waits = [w for w in waits if w is not None]
+        if waits:
+            self._schedule_wake(min(waits))
+        return None
+
+    def _schedule_wake(self, delay: float):
+        # разбудить очередь, когда предохранитель хоста снова пустит пробную загрузку
+        if self._wake_timer and self._wake_timer.is_alive():
+            return
+        self._wake_timer = threading.Timer(delay + 0.05, self._wake.emit)
+        self._wake_timer.daemon = True
+        self._wake_timer.start()
+
     def _try_start_more(self):
+        post: List[Callable[[], Any]] = []
+        started: List[Optional[Dict[str, Any]]] = []  # дельты «Загрузка» — отправляем уже без лока
         with self._lock:
             while len(self._active) < self.max_concurrent and self._queue:
-                tid = self._queue.pop(0)
-                t = self._tasks.get(tid)
-                if not t:
-                    continue
-                w = DownloadWorker(t["url"], t["out_dir"], t["title"], t["height"], self.concurrent_fragments)
-                w.paused.connect(lambda title, tid=tid: self._on_paused(tid))
-                self._active[tid] = w
-                t["status"] = "Загрузка"
-                self.task_status.emit(dict(t))
-                w.progress.connect(lambda p, tid=tid: self._on_progress(tid, p))
-                w.metrics.connect(lambda dl, tot, spd, eta, tid=tid: self._on_metrics(tid, dl, tot, spd, eta))
-                w.finished.connect(lambda rc, title, path, tid=tid: self._on_finished(tid, rc, path))
-                w.canceled.connect(lambda title, tid=tid: self._on_canceled(tid))
-                w.start()
+                tid = self._next_startable()
+                if tid is None:
+                    break
+                started.append(self._start_worker(tid, post))
+        for fn in post:
+            fn()
+        for d in started:
+            self._emit_status(d)
+        self._plan_prefetch()
+
+    def _start_worker(self, tid: int, post: List[Callable[[], Any]]) -> Optional[Dict[str, Any]]:
+        # под self._lock; вызовы телеметрии откладываются в post, а дельту статуса возвращаем —
+        # и то и другое вызывающий выполняет/отправляет уже после лока
+        t = self._tasks[tid]
+        info = self._prefetch.take(tid)
+        w = DownloadWorker(t.url, t.out_dir, t.title, t.height, self.concurrent_fragments,
+                           info_json=info, on_line=lambda s, tid=tid: self.log.engine(tid, s),
+                           rate_limit=self.rate_limit_mbs)
+        post.append(partial(self.telemetry.phase, tid, "extract"))
+        post.append(partial(self.telemetry.note, tid, prefetched=bool(info)))
+        w.phase.connect(lambda ph, tid=tid: self.telemetry.phase(tid, ph))
+        w.paused.connect(lambda title, tid=tid: self._on_paused(tid))
+        self._active[tid] = w
+        t.update(status="Загрузка")
+        d = t.delta()
+        w.progress.connect(lambda p, tid=tid: self._on_progress(tid, p))
+        w.metrics.connect(lambda dl, tot, spd, eta, tid=tid: self._on_metrics(tid, dl, tot, spd, eta))
+        w.finished.connect(lambda rc, title, path, tid=tid: self._on_finished(tid, rc, path))
+        w.canceled.connect(lambda title, tid=tid: self._on_canceled(tid))
+        w.start()
+        return d
+
+    def _plan_prefetch(self):
+        # предизвлекаем первые depth задач очереди, если слот для них освободится
+        # раньше, чем протухнут подписанные ссылки (оценка — по ETA активных загрузок)
+        with self._lock:
+            depth = self._prefetch.depth
+            if not depth or not self._queue:
+                return
+            free = max(0, self.max_concurrent - len(self._active))
+            # ETA 0 — загрузка вот-вот закончится; бесконечность — только если оценки нет
+            etas = sorted(float("inf") if e is None else e
+                          for e in (eta_seconds(self._tasks[a].eta) for a in self._active if a in self._tasks))
+            horizon = self._prefetch.ttl - self._prefetch.margin
+            cands = []
+            for k, tid in enumerate(self._ordered_queue()[:depth]):
+                j = k - free  # k-я в очереди получит слот, когда освободится j-й активный
+                start_in = 0.0 if j < 0 else (etas[j] if j < len(etas) else float("inf"))
+                if start_in <= horizon:
+                    cands.append((tid, self._tasks[tid].url))
+        self._prefetch.schedule(cands)
 
     def _on_paused(self, tid: int):
+        d, restarted = None, False
+        post: List[Callable[[], Any]] = []
         with self._lock:
             t = self._tasks.get(tid)
-            if t:
-                t["status"] = "Пауза"
             self._active.pop(tid, None)
-        if t:
-            self.task_status.emit(dict(t))
+            if t and t.status == "canceling":
+                pass  # отмену нажали, пока менеджер перезапускал задачу
+            elif t and tid in self._restart:
+                self._restart.discard(tid)
+                d = self._start_worker(tid, post)  # тот же слот, новые параметры
+                restarted = True
+            elif t and tid in self._suspend:
+                self._suspend.discard(tid)
+                self._breaker.release(t.host)
+                t.update(status="queued")
+                self._queue.insert(0, tid)
+                d = t.delta()
+            elif t:
+                t.update(status="Пауза")
+                self._breaker.release(t.host)
+                d = t.delta()
+            if not restarted:
+                self._prefetch.discard(tid)
+        for fn in post:
+            fn()
+        if restarted:
+            return self._emit_status(d)
+        if t and t.status == "canceling":
+            return self._on_canceled(tid)
+        self.telemetry.phase(tid, "queued" if t and t.status == "queued" else "paused")
+        self._emit_status(d)
 
 
     def _on_progress(self, tid: int, prog: int):
         with self._lock:
-            if tid in self._tasks:
-                self._tasks[tid]["progress"] = prog
+            t = self._tasks.get(tid)
+            if t is not None:
+                t.set_progress(prog)
         self.task_progress.emit(tid, prog)
 
     def _on_metrics(self, tid: int, dl: float, tot: float, spd: float, eta: str):
         with self._lock:
             t = self._tasks.get(tid)
             if t is not None:
-                t["dl_mb"], t["tot_mb"], t["spd_mbs"], t["eta"] = dl, tot, spd, eta
+                t.set_metrics(dl, tot, spd, eta)
+            if spd > 0:
+                self._speed_mbs = spd if self._speed_mbs <= 0 else 0.8 * self._speed_mbs + 0.2 * spd
+            now = time.monotonic()
+            replan = now - self._prefetch_at >= 1.0
+            if replan:
+                self._prefetch_at = now
+        self.telemetry.sample(tid, dl, spd)
         self.task_metrics.emit(tid, dl, tot, spd, eta)
+        if replan:
+            self._plan_prefetch()
+
+    def _on_prefetched(self, tid: int, meta: Dict[str, Any]):
+        # предизвлечённые метаданные дают ожидаемый размер для политики планирования
+        with self._lock:
+            t = self._tasks.get(tid)
+            if t and not t.expected_mb:
+                t.update(expected_mb=expected_size_mb(meta, t.height))
 
     def _on_finished(self, tid: int, rc: int, path: str):
+        d = None
+        post: List[Callable[[], Any]] = []
         with self._lock:
             t = self._tasks.get(tid)
+            w = self._active.pop(tid, None)
+            self._prefetch.discard(tid)
             if t:
-                t["path"] = path or t.get("path", "")
-                t["status"] = "Готово" if rc == 0 else f"Ошибка({rc})"
-            self._active.pop(tid, None)
-        if t:
-            self.task_status.emit(dict(t))
+                t.update(path=path or t.path)
+                post.append(partial(self.telemetry.note, tid, retries=t.attempts,
+                                    fragments=w.frag_count if w else 0))
+                if rc == 0:
+                    self._breaker.record_success(t.host)
+                    if self.postprocess and self._post.submit(tid, t.path, self._meta_titles.pop(tid, ""),
+                                                                self._thumbs.get(tid)):
+                        self._thumbs.pop(tid, None)  # файл обложки теперь удалит PostProcessor
+                        t.update(status="Обработка")
+                        post.append(partial(self.telemetry.phase, tid, "postprocess"))
+                    else:
+                        self._drop_thumb(tid)
+                        t.update(status="Готово")
+                        self.log.info(f"#{tid} Готово — {t.path or t.title}", tid)
+                        post.append(partial(self.telemetry.finish, tid, "done", mb=t.tot_mb))
+                else:
+                    self._on_failed(t, rc, "\n".join(w.tail) if w else "", post)
+                d = t.delta()
+        for fn in post:
+            fn()
+        self._warn_outdated()
+        self._emit_status(d)
         self._try_start_more()
 
+    def _warn_outdated(self):
+        # к первому завершению воркера find_yt_dlp уже отработал и версия известна
+        if self._ytdlp_warned:
+            return
+        old = yt_dlp_outdated()
+        if old:
+            self._ytdlp_warned = True
+            need = ".".join(f"{x:02d}" if i else str(x) for i, x in enumerate(MIN_YT_DLP_VERSION))
+            self.log.warn(f"yt-dlp {old} устарел (нужен {need} или новее) — обнови: yt-dlp -U")
+
+    def _on_postprocessed(self, tid: int, res: Dict[str, Any]):
+        d = None
+        with self._lock:
+            t = self._tasks.get(tid)
+            if t:
+                t.update(status="Готово")
+                if res.get("ok"):
+                    if not res.get("skipped"):
+                        self.log.info(f"#{tid} Готово — {t.path} (faststart {res['seconds']:.1f}с,"
+                                      f" ожидание диска {res['waited']:.1f}с)", tid)
+                    else:
+                        self.log.info(f"#{tid} Готово — {t.path}", tid)
+                else:
+                    # файл остаётся как есть — он целый, просто без переноса индекса
+                    self.log.warn(f"#{tid} Готово без обработки: {res.get('error')}", tid)
+                d = t.delta()
+        if d:
+            self.telemetry.finish(tid, "done", mb=t.tot_mb)
+        self._emit_status(d)
+
+    def _on_failed(self, t: Task, rc: int, output: str, post: List[Callable[[], Any]]):
+        # классифицируем ошибку и либо планируем повтор, либо фиксируем провал
+        # (под self._lock; телеметрия — в post, после лока)
+        kind = classify_error(rc, output)
+        t.update(error_kind=kind)
+        tail = output.splitlines()
+        self.log.keep_tail(t.id, tail)
+        if kind in HOST_FAILURES:
+            self._breaker.record_failure(t.host)
+        else:
+            self._breaker.release(t.host)
+        if kind in RETRYABLE and t.attempts < self.max_retries:
+            attempts = t.attempts + 1
+            delay = backoff_delay(attempts, kind)
+            t.update(attempts=attempts,
+                     status=f"Повтор {attempts}/{self.max_retries} через {delay:.0f}с ({ERROR_LABELS[kind]})")
+            timer = threading.Timer(delay, self._retry, args=(t.id,))
+            timer.daemon = True
+            self._retry_timers[t.id] = timer
+            timer.start()
+            post.append(partial(self.telemetry.phase, t.id, "backoff"))
+            self.log.warn(f"#{t.id} {t.status}", t.id)
+        else:
+            t.update(status=f"Ошибка({rc}): {ERROR_LABELS[kind]}")
+            self._drop_thumb(t.id)
+            self.log.error(f"#{t.id} {t.status} — {t.title}", t.id, tail=tail)
+            post.append(partial(self.telemetry.finish, t.id, "error"))
+
+    def _retry(self, tid: int):
+        with self._lock:
+            if self._retry_timers.pop(tid, None) is None:
+                return
+            t = self._tasks.get(tid)
+            if not t:
+                return
+            t.update(status="queued")
+            self._queue.append(tid)  # --continue докачает уже скачанные части
+            d = t.delta()
+        self.telemetry.phase(tid, "queued")
+        self._emit_status(d)
+        self._wake.emit()
+
     def _on_canceled(self, tid: int):
+        d = None
         with self._lock:
             t = self._tasks.get(tid)
             if t:
-                t["status"] = "Отменено"
+                t.update(status="Отменено")
+                self._breaker.release(t.host)
+                d = t.delta()
             self._active.pop(tid, None)
-        if t:
-            self.task_status.emit(dict(t))
+            self._drop_thumb(tid)
+            self._prefetch.discard(tid)
+        self.telemetry.finish(tid, "canceled")
+        self._emit_status(d)
         self._try_start_more()